@@ -0,0 +1,407 @@
+# Mustard Tools benchmark script
+# https://github.com/Mustard2/MustardTools
+#
+# Benchmark of the Mustard Tools operators on procedurally generated scenes, to be run in background:
+#   blender -b --factory-startup --python benchmark.py -- --output results.json
+# Use --quick for a shorter run with smaller scenes, and --only to run only the benchmarks with a name containing the specified text.
+# The results (with the phases recorded by the tools profiling) are written as JSON, to be compared between versions.
+
+import bpy
+import sys
+import os
+import math
+import time
+import json
+import argparse
+import platform
+import numpy as np
+
+# The addon is imported from the folder of this script
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mustard_tools
+
+# ------------------------------------------------------------------------
+#    Scene generation
+# ------------------------------------------------------------------------
+
+# Remove all the data generated by the previous benchmark
+def benchmark_reset():
+    
+    if bpy.context.object != None and bpy.context.object.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    
+    ids = list(bpy.data.objects) + list(bpy.data.armatures) + list(bpy.data.curves) + list(bpy.data.actions) + list(bpy.data.materials)
+    bpy.data.batch_remove(ids=ids)
+    
+    mustard_tools.mustardtools_chain_index_invalidate()
+    mustard_tools.mustardtools_constraint_index_invalidate()
+    mustard_tools.mustardtools_slide_keyframes_index_invalidate()
+
+# Create an armature with the specified number of chains, each one with the specified number of connected bones.
+# The chains are wavy, so that adaptive controllers and automatic poles have a bend to work with.
+# If symmetric, each chain has a counterpart on the other side, with .L and .R names
+def benchmark_armature(chains_num, chain_length, symmetric=False):
+    
+    data = bpy.data.armatures.new("Benchmark")
+    arm = bpy.data.objects.new("Benchmark", data)
+    bpy.context.scene.collection.objects.link(arm)
+    bpy.context.view_layer.objects.active = arm
+    arm.select_set(True)
+    
+    bpy.ops.object.mode_set(mode='EDIT')
+    
+    sides = [("L", 1.), ("R", -1.)] if symmetric else [("", 1.)]
+    chains = []
+    
+    for side, sign in sides:
+        for c in range(0, chains_num):
+            chain = []
+            parent = None
+            for i in range(0, chain_length):
+                name = "Chain" + str(c) + ".Bone" + str(i) + ("." + side if side != "" else "")
+                bone = data.edit_bones.new(name)
+                bone.head = (sign * (0.5 + 0.2 * c), 0.1 * i, 0.05 * math.sin(0.5 * i))
+                bone.tail = (sign * (0.5 + 0.2 * c), 0.1 * (i+1), 0.05 * math.sin(0.5 * (i+1)))
+                bone.parent = parent
+                bone.use_connect = parent != None
+                parent = bone
+                chain.append(name)
+            chains.append(chain)
+    
+    bpy.ops.object.mode_set(mode='POSE')
+    
+    return arm, chains
+
+# Select the specified bones. The depsgraph is updated, so that the selection summary used by the poll functions
+# is invalidated as after a selection in the UI
+def benchmark_select(arm, names):
+    
+    names = set(names)
+    for bone in arm.data.bones:
+        bone.select = bone.name in names
+    
+    bpy.context.view_layer.update()
+
+# Create an object with an action with the specified number of keyframes, split in fcurves_num F-Curves.
+# The keyframes in the first half of the action are selected
+def benchmark_action(keys_num, fcurves_num=10):
+    
+    obj = bpy.data.objects.new("Benchmark", None)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+    
+    action = bpy.data.actions.new("Benchmark")
+    obj.animation_data_create().action = action
+    
+    keys_per_fcurve = max(keys_num // fcurves_num, 2)
+    frames = np.arange(keys_per_fcurve, dtype=np.float32)
+    rng = np.random.default_rng(0)
+    
+    for i in range(0, fcurves_num):
+        fcurve = action.fcurves.new('["benchmark_' + str(i) + '"]')
+        fcurve.keyframe_points.add(keys_per_fcurve)
+        
+        co = np.empty((keys_per_fcurve, 2), dtype=np.float32)
+        co[:, 0] = frames
+        co[:, 1] = rng.random(keys_per_fcurve)
+        fcurve.keyframe_points.foreach_set("co", co.ravel())
+        fcurve.keyframe_points.foreach_set("handle_left", (co - [0.3, 0.]).ravel())
+        fcurve.keyframe_points.foreach_set("handle_right", (co + [0.3, 0.]).ravel())
+        
+        select = frames < keys_per_fcurve / 2
+        fcurve.keyframe_points.foreach_set("select_control_point", select)
+        fcurve.update()
+    
+    return obj, action
+
+# Create materials with AO and Bevel nodes, used by the OptiX Compatibility tool
+def benchmark_materials(materials_num):
+    
+    for i in range(0, materials_num):
+        mat = bpy.data.materials.new("Benchmark")
+        mat.use_nodes = True
+        mat.node_tree.nodes.new('ShaderNodeAmbientOcclusion')
+        mat.node_tree.nodes.new('ShaderNodeBevel')
+
+# ------------------------------------------------------------------------
+#    Benchmarks
+# ------------------------------------------------------------------------
+
+# Time a function (setup is run before each repetition, and not timed nor profiled).
+# Returns the result entry, with the times of the repetitions and the phases recorded by the tools profiling in all of them
+def benchmark_run(name, params, setup, function, repeat):
+    
+    times = []
+    mustard_tools.mustardtools_profile_reset()
+    
+    for r in range(0, repeat):
+        benchmark_reset()
+        mustard_tools.mustardtools_profile_enabled = False
+        state = setup()
+        mustard_tools.mustardtools_profile_enabled = True
+        
+        start = time.perf_counter()
+        function(state)
+        times.append(time.perf_counter() - start)
+    
+    phases = {key: mustard_tools.mustardtools_profile_stats(records) for key, records in mustard_tools.mustardtools_profile_records.items()}
+    
+    result = {"name": name,
+            "params": params,
+            "times_ms": [t * 1000. for t in times],
+            "median_ms": float(np.median(times)) * 1000.,
+            "min_ms": float(np.min(times)) * 1000.,
+            "phases_ms": phases}
+    
+    print("MustardTools Benchmark - " + name + " " + str(params) + ": " + str(round(result["median_ms"], 2)) + " ms")
+    
+    return result
+
+def benchmark_ik_chain(chains_num, chain_length, symmetric, repeat):
+    
+    settings = bpy.context.scene.mustardtools_settings
+    
+    def setup():
+        settings.ik_chain_multi = True
+        settings.ik_chain_symmetry = symmetric
+        arm, chains = benchmark_armature(chains_num, chain_length, symmetric)
+        # With symmetry, only one side is selected
+        selected = chains[:chains_num] if symmetric else chains
+        benchmark_select(arm, [name for chain in selected for name in chain])
+        return arm, chains
+    
+    def run(state):
+        bpy.ops.mustardui.ik_chain()
+    
+    return benchmark_run("ik_chain", {"chains": chains_num, "chain_length": chain_length, "symmetry": symmetric}, setup, run, repeat)
+
+def benchmark_ik_chain_pole(chains_num, chain_length, repeat):
+    
+    settings = bpy.context.scene.mustardtools_settings
+    
+    def setup():
+        settings.ik_chain_multi = True
+        settings.ik_chain_symmetry = False
+        settings.ik_chain_pole_auto = True
+        arm, chains = benchmark_armature(chains_num, chain_length)
+        benchmark_select(arm, [name for chain in chains for name in chain])
+        bpy.ops.mustardui.ik_chain()
+        benchmark_select(arm, [name for chain in chains for name in chain])
+        return arm, chains
+    
+    def run(state):
+        bpy.ops.mustardui.ik_chainpole()
+    
+    return benchmark_run("ik_chain_pole", {"chains": chains_num, "chain_length": chain_length}, setup, run, repeat)
+
+def benchmark_ik_chain_clean(chains_num, chain_length, repeat):
+    
+    settings = bpy.context.scene.mustardtools_settings
+    
+    def setup():
+        settings.ik_chain_multi = True
+        settings.ik_chain_symmetry = False
+        settings.ik_chain_pole_auto = True
+        arm, chains = benchmark_armature(chains_num, chain_length)
+        benchmark_select(arm, [name for chain in chains for name in chain])
+        bpy.ops.mustardui.ik_chain()
+        benchmark_select(arm, [name for chain in chains for name in chain])
+        bpy.ops.mustardui.ik_chainpole()
+        benchmark_select(arm, [name for chain in chains for name in chain])
+        return arm, chains
+    
+    def run(state):
+        bpy.ops.mustardui.ik_chainclean()
+    
+    return benchmark_run("ik_chain_clean", {"chains": chains_num, "chain_length": chain_length}, setup, run, repeat)
+
+def benchmark_ik_spline_setup(chain_length, controllers, adaptive, fit, bone_hooks):
+    
+    settings = bpy.context.scene.mustardtools_settings
+    settings.ik_spline_number = controllers
+    settings.ik_spline_adaptive = adaptive
+    settings.ik_spline_fit = fit
+    settings.ik_spline_bone_hooks = bone_hooks
+    settings.ik_spline_symmetry = False
+    
+    arm, chains = benchmark_armature(1, chain_length)
+    benchmark_select(arm, chains[0])
+    
+    return arm, chains
+
+def benchmark_ik_spline(chain_length, controllers, adaptive, fit, bone_hooks, repeat):
+    
+    def setup():
+        return benchmark_ik_spline_setup(chain_length, controllers, adaptive, fit, bone_hooks)
+    
+    def run(state):
+        bpy.ops.mustardui.ik_spline()
+    
+    return benchmark_run("ik_spline", {"chain_length": chain_length, "controllers": controllers, "adaptive": adaptive, "fit": fit, "bone_hooks": bone_hooks}, setup, run, repeat)
+
+def benchmark_ik_spline_clean(chain_length, controllers, bone_hooks, repeat):
+    
+    def setup():
+        arm, chains = benchmark_ik_spline_setup(chain_length, controllers, False, False, bone_hooks)
+        bpy.ops.mustardui.ik_spline()
+        benchmark_select(arm, chains[0])
+        return arm, chains
+    
+    def run(state):
+        bpy.ops.mustardui.ik_splineclean()
+    
+    return benchmark_run("ik_spline_clean", {"chain_length": chain_length, "controllers": controllers, "bone_hooks": bone_hooks}, setup, run, repeat)
+
+# The Slide Keyframes operator is modal, and cannot receive mouse events in background.
+# Its session is driven with the same calls of the operator: creation in invoke, a move for each mouse event
+# (with a timer event every timer_steps moves when coalescing the updates), and the final confirmation.
+# The runs are recorded with the operator name, so that the phases match the ones of the interactive tool
+def benchmark_slide_keyframes(keys_num, steps, coalesce, repeat, timer_steps=4):
+    
+    key = mustard_tools.MUSTARDTOOLS_OT_SlideKeyframes.bl_idname
+    
+    def setup():
+        return benchmark_action(keys_num)
+    
+    def step(session):
+        with mustard_tools.mustardtools_profile_record(key):
+            session.step()
+    
+    def run(state):
+        obj, action = state
+        
+        # Invoke
+        with mustard_tools.mustardtools_profile_record(key + " (invoke)"):
+            session = mustard_tools.MustardTools_SlideKeyframesSession(mustard_tools.mustardtools_slide_keyframes_actions([obj]), coalesce)
+            session.move(session.end)
+            step(session)
+        
+        # Modal steps, sliding the end of the range up to twice its length
+        for i in range(1, steps + 1):
+            if session.move(session.end + (session.end - session.start) * i / steps):
+                step(session)
+            if i % timer_steps == 0 and session.pending != None:
+                step(session)
+        
+        # Confirm
+        if session.pending != None:
+            step(session)
+        session.confirm()
+    
+    return benchmark_run("slide_keyframes", {"keys": keys_num, "steps": steps, "coalesce": coalesce}, setup, run, repeat)
+
+def benchmark_slide_keyframes_api(keys_num, repeat):
+    
+    def setup():
+        return benchmark_action(keys_num)
+    
+    def run(state):
+        obj, action = state
+        mustard_tools.mustardtools_slide_keyframes([action], 0., keys_num / 20., keys_num / 10.)
+    
+    return benchmark_run("slide_keyframes_api", {"keys": keys_num}, setup, run, repeat)
+
+def benchmark_optix(materials_num, revert, repeat):
+    
+    def setup():
+        benchmark_materials(materials_num)
+    
+    def run(state):
+        bpy.ops.mustardui.optix_compatibility(revert=revert)
+    
+    return benchmark_run("optix_compatibility", {"materials": materials_num, "revert": revert}, setup, run, repeat)
+
+# ------------------------------------------------------------------------
+#    Main
+# ------------------------------------------------------------------------
+
+def benchmark_parser():
+    
+    parser = argparse.ArgumentParser(prog="benchmark",
+                                    description="MustardTools Benchmark - Time the Mustard Tools operators on generated scenes")
+    parser.add_argument("--output", default="mustardtools_benchmark.json", help="JSON file where the results are written")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of repetitions of each benchmark")
+    parser.add_argument("--quick", action="store_true", help="Use smaller scenes, for a quick check")
+    parser.add_argument("--only", default="", help="Run only the benchmarks with a name containing this text")
+    
+    return parser
+
+# List of (name, function) of all the benchmarks.
+# Spline IK and IK constraints are limited to chains of 255 bones, so the larger armatures are made of many chains
+def benchmark_list(quick, repeat):
+    
+    chain_bones = [10, 100] if quick else [10, 100, 1000]
+    spline_bones = [10, 100] if quick else [10, 100, 250]
+    keys = [1000, 10000] if quick else [1000, 100000, 1000000]
+    materials = 1000 if quick else 10000
+    
+    benchmarks = []
+    
+    for bones in chain_bones:
+        chains_num = max(bones // 10, 1)
+        benchmarks.append(("ik_chain", lambda n=chains_num: benchmark_ik_chain(n, 10, False, repeat)))
+        benchmarks.append(("ik_chain", lambda n=chains_num: benchmark_ik_chain(n, 10, True, repeat)))
+        benchmarks.append(("ik_chain_pole", lambda n=chains_num: benchmark_ik_chain_pole(n, 10, repeat)))
+        benchmarks.append(("ik_chain_clean", lambda n=chains_num: benchmark_ik_chain_clean(n, 10, repeat)))
+    
+    for bones in spline_bones:
+        controllers = min(max(bones // 10, 3), 20)
+        benchmarks.append(("ik_spline", lambda b=bones, c=controllers: benchmark_ik_spline(b, c, False, False, False, repeat)))
+        benchmarks.append(("ik_spline", lambda b=bones, c=controllers: benchmark_ik_spline(b, c, True, True, True, repeat)))
+        benchmarks.append(("ik_spline_clean", lambda b=bones, c=controllers: benchmark_ik_spline_clean(b, c, False, repeat)))
+        benchmarks.append(("ik_spline_clean", lambda b=bones, c=controllers: benchmark_ik_spline_clean(b, c, True, repeat)))
+    
+    for keys_num in keys:
+        benchmarks.append(("slide_keyframes", lambda k=keys_num: benchmark_slide_keyframes(k, 60, False, repeat)))
+        benchmarks.append(("slide_keyframes", lambda k=keys_num: benchmark_slide_keyframes(k, 60, True, repeat)))
+        benchmarks.append(("slide_keyframes_api", lambda k=keys_num: benchmark_slide_keyframes_api(k, repeat)))
+    
+    benchmarks.append(("optix_compatibility", lambda: benchmark_optix(materials, False, repeat)))
+    benchmarks.append(("optix_compatibility", lambda: benchmark_optix(materials, True, repeat)))
+    
+    return benchmarks
+
+def benchmark_main(argv=None):
+    
+    # Blender arguments are separated from the script ones with --
+    if argv == None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    
+    args = benchmark_parser().parse_args(argv)
+    
+    mustard_tools.register()
+    
+    # The phases of each operator are recorded with the tools profiling
+    settings = bpy.context.scene.mustardtools_settings
+    settings.ms_profiling = True
+    
+    results = []
+    for name, benchmark in benchmark_list(args.quick, max(args.repeat, 1)):
+        if args.only not in name:
+            continue
+        try:
+            results.append(benchmark())
+        except Exception as error:
+            print("MustardTools Benchmark - " + name + " failed: " + str(error))
+            results.append({"name": name, "error": str(error)})
+    
+    benchmark_reset()
+    
+    output = {"blender": bpy.app.version_string,
+            "addon": ".".join(str(v) for v in mustard_tools.bl_info["version"]),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "repeat": args.repeat,
+            "results": results}
+    
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    
+    print("MustardTools Benchmark - " + str(len(results)) + " results written to " + args.output)
+    
+    return 1 if any("error" in result for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(benchmark_main())
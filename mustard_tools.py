@@ -18,7 +18,19 @@ import os
 import re
 import time
 import math
+import logging
+import json
+import functools
+import heapq
+import bisect
+import collections
+import uuid
+import argparse
+import subprocess
+import concurrent.futures
+import numpy as np
 from bpy.props import *
+from bpy.app.handlers import persistent
 from mathutils import Vector, Color
 import webbrowser
 
@@ -41,9 +53,33 @@ def mustardtools_ms_advanced_update(self, context):
         settings.ik_spline_bone_custom_shape = None
         settings.ik_spline_first_bone_custom_shape = None
         settings.ik_spline_resolution = 32
+        settings.ik_spline_tolerance = 0.1
     
     return
         
+# Function for debug settings (the loggers level depends on the debug mode)
+def mustardtools_ms_debug_update(self, context):
+    
+    mustardtools_log_configure(self.ms_debug, self.ms_debug_log_file)
+    
+    return
+
+# Function for profiling settings (the status is mirrored in a global variable, to be checked with no overhead)
+def mustardtools_ms_profiling_update(self, context):
+    
+    global mustardtools_profile_enabled
+    
+    mustardtools_profile_enabled = self.ms_profiling
+    
+    return
+
+# Function for Slide Keyframes settings (the selection index depends on the considered objects)
+def mustardtools_slide_keyframes_settings_update(self, context):
+    
+    mustardtools_slide_keyframes_index_invalidate()
+    
+    return
+
 # Class with all the settings variables
 class MustardTools_Settings(bpy.types.PropertyGroup):
     
@@ -54,14 +90,30 @@ class MustardTools_Settings(bpy.types.PropertyGroup):
                                         default=False,
                                         update=mustardtools_ms_advanced_update)
     ms_debug: bpy.props.BoolProperty(name="Debug mode",
-                                        description="Unlock debug mode.\nThis will generate more messaged in the console.\nEnable it only if you encounter problems, as it might degrade general Blender performance",
-                                        default=False)
+                                        description="Unlock debug mode.\nThis will generate more messages in the console (and in the log file, if set).\nEnable it only if you encounter problems",
+                                        default=False,
+                                        update=mustardtools_ms_debug_update)
+    ms_debug_log_file: bpy.props.StringProperty(name="Log File",
+                                        subtype='FILE_PATH',
+                                        default="",
+                                        description="File where the debug messages are also written, one per line with tab separated fields.\nLeave empty to use the console only",
+                                        update=mustardtools_ms_debug_update)
+    ms_profiling: bpy.props.BoolProperty(name="Profiling",
+                                        description="Record the time spent by the tools in each phase (mode switches, bone creation, constraints, ...).\nThe statistics of the last runs are shown in the Settings panel, and can be exported to a JSON file",
+                                        default=False,
+                                        update=mustardtools_ms_profiling_update)
     ms_naming_prefix: bpy.props.StringProperty(name="",
                                                 default="MustardTools",
                                                 description="Name prefix for the objects created by the addon")
     
     # IK Chain Tool definitions
     # UI definitions
+    ik_chain_multi: bpy.props.BoolProperty(name="Multiple Chains",
+                                                    description="Create an IK rig for each chain found in the selection (e.g. all the fingers of a hand).\nChains are detected using the bones parent hierarchy",
+                                                    default=False)
+    ik_chain_symmetry: bpy.props.BoolProperty(name="Symmetry",
+                                                    description="Also create the IK rig (and the pole) on the counterpart chain of the other side, found from the bone names (e.g. Arm.L and Arm.R, Arm_l and Arm_r, LeftArm and RightArm).\nBoth rigs are created at the same time",
+                                                    default=False)
     ik_chain_last_bone_use: bpy.props.BoolProperty(name="Last Bone Controller",
                                                     description="Use last bone as the controller instead of creating a new bone at the end of the chain",
                                                     default=False)
@@ -75,6 +127,12 @@ class MustardTools_Settings(bpy.types.PropertyGroup):
                                                                 name="",
                                                                 description="Object that will be used as custom shape for the IK controller",
                                                                 poll=mustardtools_poll_mesh)
+    ik_chain_pole_auto: bpy.props.BoolProperty(name="Automatic",
+                                                    description="Place the poles automatically in the bend plane of the chains, and compute the pole angles so that the chains keep their rest position.\nThe poles are added to all the selected bones with an IK constraint without pole",
+                                                    default=False)
+    ik_chain_pole_distance: bpy.props.FloatProperty(name="Distance",
+                                                    default=0.5,min=0.01,max=10.,
+                                                    description="Distance of the automatic pole from the chain, relative to the chain length")
     ik_chain_pole_angle: bpy.props.IntProperty(name="Pole Angle",
                                                     default=90,min=-180,max=180,
                                                     description="Pole rotation offset.\nChange this value if the rotation of the bones in the result are wrong (usually this is 90 or -90 degrees)")
@@ -99,6 +157,22 @@ class MustardTools_Settings(bpy.types.PropertyGroup):
     ik_spline_resolution: bpy.props.IntProperty(default=32,min=1,max=64,
                                             name="Resolution",
                                             description="Resolution of the spline.\nSubdivision performed on each segment of the curve")
+    ik_spline_adaptive: bpy.props.BoolProperty(name="Adaptive",
+                                                    description="Place the controllers where the curve follows the chain most closely (more of them where the chain bends), and use the lowest curve resolution that fits the chain within the tolerance.\nIf disabled, the controllers are evenly spaced and the Resolution setting is used",
+                                                    default=False)
+    ik_spline_fit: bpy.props.BoolProperty(name="Fit Curve",
+                                                    description="Compute the curve handles with a least-squares fit on all the chain bones.\nThe curve follows the chain more closely, allowing to use less controllers",
+                                                    default=False)
+    ik_spline_tolerance: bpy.props.FloatProperty(default=0.1,min=0.001,max=10.,
+                                                    name="Tolerance",
+                                                    subtype='PERCENTAGE',
+                                                    description="Maximum fitting error of the curve, relative to the chain length.\nUsed to compute the curve resolution in Adaptive mode")
+    ik_spline_symmetry: bpy.props.BoolProperty(name="Symmetry",
+                                                    description="Also create the IK spline rig on the counterpart chain of the other side, found from the bone names (e.g. Tail.L and Tail.R, Tail_l and Tail_r, LeftTail and RightTail).\nBoth rigs are created at the same time",
+                                                    default=False)
+    ik_spline_bone_hooks: bpy.props.BoolProperty(name="Bone Hooks",
+                                                    description="Hook the curve directly to the controller bones, without creating helper empties.\nThis reduces the number of objects evaluated at every frame",
+                                                    default=False)
     ik_spline_bendy: bpy.props.BoolProperty(name="Bendy Bones",
                                                     description="Convert the bones of the chain to bendy bones",
                                                     default=False)
@@ -121,362 +195,1240 @@ class MustardTools_Settings(bpy.types.PropertyGroup):
                                                             items = [('0','Active','Consider the active object only'), 
                                                                     ('1','Selected','Consider all the selected objects'),
                                                                     ('2','All','Consider all objects in the scene')],
-                                                            default = '0')
+                                                            default = '0',
+                                                            update = mustardtools_slide_keyframes_settings_update)
+    slide_keyframes_coalesce: bpy.props.BoolProperty(name="Coalesce Updates",
+                                                    description="Apply the slide at most once per redraw, using only the last mouse position.\nEnable it to keep the tool responsive on heavy scenes",
+                                                    default=True)
+    slide_keyframes_coalesce_rate: bpy.props.IntProperty(name="Rate",
+                                                    default=60,min=10,max=240,
+                                                    description="Maximum number of updates per second when coalescing updates")
+    slide_keyframes_nla: bpy.props.BoolProperty(name="NLA Strips",
+                                                description="Also slide the keyframes of the actions in the NLA strips.\nThe keyframes are slid in the action time, not considering the strip offset",
+                                                default=False,
+                                                update=mustardtools_slide_keyframes_settings_update)
 
 bpy.utils.register_class(MustardTools_Settings)
 
 bpy.types.Scene.mustardtools_settings = bpy.props.PointerProperty(type=MustardTools_Settings)
 
 # ------------------------------------------------------------------------
-#    IK Chain Tool
+#    Logging
 # ------------------------------------------------------------------------
+#
+# Debug messages are sent to a logger for each tool, children of the MustardTools logger.
+# The messages are formatted lazily, so they have no cost when the debug mode is disabled.
+# In debug mode, the messages can also be written to a file, with tab separated fields.
 
-class MUSTARDTOOLS_OT_IKChain(bpy.types.Operator):
-    """This tool will create an IK rig on the selected chain.\nSelect the bones, the last one being the tip of the chain where the controller will be placed.\n\nCondition: select at least 3 bones"""
-    bl_idname = "mustardui.ik_chain"
-    bl_label = "Create"
-    bl_options = {'REGISTER','UNDO'}
+mustardtools_log = logging.getLogger("MustardTools")
+mustardtools_log_ik_chain = logging.getLogger("MustardTools.ik_chain")
+mustardtools_log_ik_spline = logging.getLogger("MustardTools.ik_spline")
+mustardtools_log_slide = logging.getLogger("MustardTools.slide")
+mustardtools_log_optix = logging.getLogger("MustardTools.optix")
+
+# Remove the handlers added by a previous load of the addon
+for handler in list(mustardtools_log.handlers):
+    mustardtools_log.removeHandler(handler)
+    handler.close()
+
+mustardtools_log.setLevel(logging.WARNING)
+mustardtools_log.propagate = False
+
+mustardtools_log_console = logging.StreamHandler(sys.stdout)
+mustardtools_log_console.setFormatter(logging.Formatter("%(name)s - %(message)s"))
+mustardtools_log.addHandler(mustardtools_log_console)
+
+mustardtools_log_file = None
+
+def mustardtools_log_configure(debug, filepath=""):
     
-    @classmethod
-    def poll(cls, context):
-        if context.mode != "POSE" or bpy.context.selected_pose_bones == None:
-            return False
-        else:
-            
-            chain_bones = bpy.context.selected_pose_bones
-            
-            if len(chain_bones) < 2:
-                return False
-            else:
-                abort_aa = False
-                for bone in chain_bones:
-                    for constraint in bone.constraints:
-                        if constraint.type == 'IK':
-                            abort_aa = True
-                            break
-                
-                if abort_aa:
-                    return False
-                else:
-                    return True
+    global mustardtools_log_file
+    
+    mustardtools_log.setLevel(logging.DEBUG if debug else logging.WARNING)
+    
+    if mustardtools_log_file != None:
+        mustardtools_log.removeHandler(mustardtools_log_file)
+        mustardtools_log_file.close()
+        mustardtools_log_file = None
+    
+    if debug and filepath != "":
+        try:
+            mustardtools_log_file = logging.FileHandler(bpy.path.abspath(filepath))
+        except OSError as error:
+            mustardtools_log.warning("Cannot open the log file %s: %s", filepath, error)
+            return
+        mustardtools_log_file.setFormatter(logging.Formatter("%(asctime)s\t%(name)s\t%(levelname)s\t%(message)s"))
+        mustardtools_log.addHandler(mustardtools_log_file)
 
-    def execute(self, context):
-        
-        # Import settings
-        settings = bpy.context.scene.mustardtools_settings
-        name_prefix = settings.ms_naming_prefix
-        
-        IKChainControllerBoneName = name_prefix + ".IK.Controller"
-        IKChainConstraintName = name_prefix + " IKChain"
+@persistent
+def mustardtools_log_load(*args):
     
-        # Definitions
-        arm = bpy.context.object
-        chain_bones = bpy.context.selected_pose_bones
-        chain_length = len(chain_bones)
-        chain_last_bone = chain_bones[chain_length-1]
-        chain_pole_bone = chain_bones[int((chain_length-1)/2)]
+    settings = bpy.context.scene.mustardtools_settings
+    
+    mustardtools_log_configure(settings.ms_debug, settings.ms_debug_log_file)
 
-        if settings.ms_debug:
-            print("MustardTools IK Chain - Armature selected: " + bpy.context.object.name)
-            print("MustardTools IK Chain - Chain length: " + str(chain_length))
-            print("MustardTools IK Chain - Last bone: " + chain_last_bone.name)
-            
-        bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-        
-        if settings.ik_chain_bendy:
-            for bone in chain_bones:
-                arm.data.edit_bones[bone.name].bbone_segments = settings.ik_chain_bendy_segments
-            if settings.ik_chain_last_bone_use:
-                arm.data.edit_bones[chain_last_bone.name].bbone_segments = 1
-            
-            arm.data.display_type = "BBONE"
-        
-        if settings.ik_chain_last_bone_use:
-            
-            IK_main_bone_edit = arm.data.edit_bones[chain_last_bone.name]
-            IK_main_bone_edit.parent = None
-            IK_main_bone_edit.use_deform = False
-            chain_last_bone = chain_bones[chain_length-2]
-            chain_length = chain_length - 1
-            IK_main_bone_name = IK_main_bone_edit.name
-        
-        else:
-            
-            chain_last_bone_edit = arm.data.edit_bones[chain_last_bone.name]
-            IK_main_bone_edit = arm.data.edit_bones.new(IKChainControllerBoneName)
-            IK_main_bone_edit.use_deform = False
-            IK_main_bone_edit.head = chain_last_bone_edit.tail
-            IK_main_bone_edit.tail = 2. * chain_last_bone_edit.tail - chain_last_bone_edit.head
-            IK_main_bone_name = IK_main_bone_edit.name
+# ------------------------------------------------------------------------
+#    Profiling
+# ------------------------------------------------------------------------
+#
+# When profiling is enabled in the settings, the wall time of every operator run is recorded, split in phases
+# (mode switches, bone creation, constraints, ...), and the last runs of each operator are kept in memory.
+# When disabled, the decorated functions are called directly and the phases are no-ops.
 
-        bpy.ops.object.mode_set(mode='POSE')
-        
-        IK_main_bone = arm.pose.bones[IK_main_bone_name]
-        IK_main_bone.custom_shape = settings.ik_chain_last_bone_custom_shape
-        IK_main_bone.use_custom_shape_bone_size = True
+# Number of runs kept for each operator
+mustardtools_profile_history = 100
 
-        IKConstr = chain_last_bone.constraints.new('IK')
-        IKConstr.name = IKChainConstraintName
-        IKConstr.use_rotation = True
-        IKConstr.target = arm
-        IKConstr.subtarget = IK_main_bone_name
-        IKConstr.chain_count = chain_length
+# Profiling status, mirrored from the settings to avoid accessing the scene at every phase
+mustardtools_profile_enabled = False
 
-        self.report({'INFO'}, 'MustardTools - IK successfully added.')
-        
-        return {'FINISHED'}
+# Records of the last runs, keyed by operator. Each record is a dictionary with the time of each phase and the total time (seconds)
+mustardtools_profile_records = {}
 
-class MUSTARDTOOLS_OT_IKChain_Pole(bpy.types.Operator):
-    """This tool will guide you in the creation of a pole for an already available IK rig.\nFor a better automatic generation, select the same chain you used to generate the IK Chain rig"""
-    bl_idname = "mustardui.ik_chainpole"
-    bl_label = "Add Pole"
-    bl_options = {'REGISTER','UNDO'}
+# Record of the run being profiled, with the stack of open phases as [name, start time]
+mustardtools_profile_current = None
+mustardtools_profile_stack = []
+
+class MustardTools_ProfilePhase:
     
-    status: BoolProperty(name='',
-        description="",
-        default=True,
-        options={'HIDDEN'}
-    )
-    cancel: BoolProperty(name='',
-        description="",
-        default=False,
-        options={'HIDDEN'}
-    )
+    __slots__ = ("name",)
     
-    @classmethod
-    def poll(cls, context):
-        
-        settings = bpy.context.scene.mustardtools_settings
-        
-        if not settings.ik_chain_pole_status:
-            
-            if context.mode != "POSE" or bpy.context.selected_pose_bones == None:
-                return False
-            else:
-                
-                chain_bones = bpy.context.selected_pose_bones
-                chain_length = len(chain_bones)
-                
-                if len(chain_bones) < 2:
-                    return False
-                else:
-                    
-                    chain_last_bone = chain_bones[chain_length-1]
-                    
-                    abort_aa = True
-                    for constraint in chain_last_bone.constraints:
-                        if constraint.type == 'IK':
-                            abort_aa = False
-                            if constraint.pole_target != None and constraint.pole_subtarget != None and constraint.pole_subtarget != "":
-                                abort_aa = True
-                    
-                    if abort_aa:
-                        return False
-                    else:
-                        return True
-                    
-        else:
-            
-            return True
+    def __init__(self, name):
+        self.name = name
+    
+    # The time of a phase does not include the time of the phases nested in it
+    def __enter__(self):
+        now = time.perf_counter()
+        if len(mustardtools_profile_stack) > 0:
+            phase = mustardtools_profile_stack[-1]
+            mustardtools_profile_current[phase[0]] = mustardtools_profile_current.get(phase[0], 0.) + now - phase[1]
+        mustardtools_profile_stack.append([self.name, now])
+        return self
+    
+    def __exit__(self, *args):
+        now = time.perf_counter()
+        name, start = mustardtools_profile_stack.pop()
+        mustardtools_profile_current[name] = mustardtools_profile_current.get(name, 0.) + now - start
+        if len(mustardtools_profile_stack) > 0:
+            mustardtools_profile_stack[-1][1] = now
+        return False
 
-    def execute(self, context):
-        
-        # Import settings
-        settings = bpy.context.scene.mustardtools_settings
-        name_prefix = settings.ms_naming_prefix
-        
-        # Naming convention
-        IKChain_Pole_Bone_Name = name_prefix + ".IK.Pole"
+class MustardTools_ProfileNull:
     
-        # Definitions
-        arm = bpy.context.object
-        
-        if self.cancel and self.status:
-                
-            IK_pole_bone_edit = arm.data.edit_bones[settings.ik_chain_pole_bone]
-            arm.data.edit_bones.remove(IK_pole_bone_edit)
-                
-            bpy.ops.object.mode_set(mode='POSE')
-                
-            self.cancel = False
-            self.status = False
-            settings.ik_chain_pole_status = False
-        
-        elif self.status and not self.cancel:
-            
-            # Definitions
-            chain_bones = bpy.context.selected_pose_bones
-            chain_length = len(chain_bones)
-            chain_last_bone = chain_bones[chain_length-1]
-            chain_pole_bone = chain_bones[int((chain_length-1)/2)]
-            
-            settings.ik_chain_pole_status = True
-            
-            if settings.ms_debug:
-                print("MustardTools IK Chain - Armature selected: " + bpy.context.object.name)
-                print("MustardTools IK Chain - Chain length: " + str(chain_length))
-                print("MustardTools IK Chain - Last bone: " + chain_last_bone.name)
-                print("MustardTools IK Chain - Pole bone reference: " + chain_pole_bone.name)
-            
-            settings.ik_chain_last_bone = chain_last_bone.name
-        
-            bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+    __slots__ = ()
     
-            chain_pole_bone_edit = arm.data.edit_bones[chain_pole_bone.name]
-            IK_pole_bone_edit = arm.data.edit_bones.new(IKChain_Pole_Bone_Name)
-            IK_pole_bone_edit.use_deform = False
-            IK_pole_bone_edit.head = chain_pole_bone_edit.head
-            IK_pole_bone_edit.tail = chain_pole_bone_edit.tail
-            
-            settings.ik_chain_pole_bone = IK_pole_bone_edit.name
-            
-            bpy.ops.armature.select_all(action='DESELECT')
-            IK_pole_bone_edit.select = True
-            IK_pole_bone_edit.select_head = True
-            IK_pole_bone_edit.select_tail = True
-            arm.data.edit_bones.active = IK_pole_bone_edit
-                        
-            print(bpy.context.selected_editable_bones)
-            
-        else:
-            
-            bpy.ops.object.mode_set(mode='POSE')
-            
-            IK_pole_bone = arm.pose.bones[settings.ik_chain_pole_bone]
-            IK_pole_bone.custom_shape = settings.ik_chain_pole_bone_custom_shape
-            IK_pole_bone.use_custom_shape_bone_size = True
-            
-            for constraint in arm.pose.bones[settings.ik_chain_last_bone].constraints:
-                if constraint.type == 'IK':
-                    IKConstr = constraint
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        return False
 
-            IKConstr.use_rotation = True
-            IKConstr.pole_target = arm
-            IKConstr.pole_subtarget = settings.ik_chain_pole_bone
-            IKConstr.pole_angle = settings.ik_chain_pole_angle * 3.141593/ 180.
-            
-            settings.ik_chain_pole_status = False
+mustardtools_profile_null = MustardTools_ProfileNull()
 
-            self.report({'INFO'}, 'MustardTools - IK pole successfully added.')
-        
-        return {'FINISHED'}
+# Context manager timing a phase of the operator being profiled
+def mustardtools_profile_phase(name):
+    
+    if mustardtools_profile_current == None:
+        return mustardtools_profile_null
+    
+    return MustardTools_ProfilePhase(name)
 
-class MUSTARDTOOLS_OT_IKChain_Clean(bpy.types.Operator):
-    """This tool will clean the available IK constraints in the selected bones.\nSelect a bone with an IK constraint to enable the tool.\nA confirmation box will appear"""
-    bl_idname = "mustardui.ik_chainclean"
-    bl_label = "Remove IK"
-    bl_options = {'REGISTER','UNDO'}
+# Context manager recording a run of an operator, keyed by the operator name.
+# The time not spent in any phase is recorded as Other
+class MustardTools_ProfileRecord:
     
-    delete_bones: BoolProperty(name='Delete bones',
-        description="Delete controller and pole bones",
-        default=True
-    )
-    reset_bendy: BoolProperty(name='Reset Bendy Bones',
-        description="Reset bendy bones to standard bones",
-        default=True
+    __slots__ = ("key", "start", "phase")
+    
+    def __init__(self, key):
+        self.key = key
+    
+    def __enter__(self):
+        global mustardtools_profile_current
+        mustardtools_profile_current = {}
+        self.start = time.perf_counter()
+        self.phase = MustardTools_ProfilePhase("Other")
+        self.phase.__enter__()
+        return self
+    
+    def __exit__(self, *args):
+        global mustardtools_profile_current
+        self.phase.__exit__(*args)
+        record = mustardtools_profile_current
+        record["Total"] = time.perf_counter() - self.start
+        mustardtools_profile_current = None
+        mustardtools_profile_stack.clear()
+        mustardtools_profile_records.setdefault(self.key, collections.deque(maxlen=mustardtools_profile_history)).append(record)
+        return False
+
+# Context manager recording a run of an operator, if profiling is enabled.
+# Nested runs are part of the outer run
+def mustardtools_profile_record(key):
+    
+    if not mustardtools_profile_enabled or mustardtools_profile_current != None:
+        return mustardtools_profile_null
+    
+    return MustardTools_ProfileRecord(key)
+
+# Record a run of an operator function
+def mustardtools_profile_run(self, function, *args):
+    
+    key = self.bl_idname if function.__name__ == "execute" else self.bl_idname + " (" + function.__name__ + ")"
+    
+    with mustardtools_profile_record(key):
+        return function(self, *args)
+
+# Decorator for the operators execute and invoke functions.
+# Blender checks the number of arguments of these functions when registering the class,
+# so the wrapper keeps the same arguments of the decorated function
+def mustardtools_profile(function):
+    
+    if function.__code__.co_argcount == 3:
+        @functools.wraps(function)
+        def wrapper(self, context, event):
+            return mustardtools_profile_run(self, function, context, event)
+    else:
+        @functools.wraps(function)
+        def wrapper(self, context):
+            return mustardtools_profile_run(self, function, context)
+    
+    return wrapper
+
+# Mode switch, recorded as a separate phase
+def mustardtools_mode_set(mode):
+    
+    with mustardtools_profile_phase("Mode switch"):
+        bpy.ops.object.mode_set(mode=mode, toggle=False)
+
+# Percentiles (in milliseconds) of the recorded runs of an operator, for the total time and each phase
+def mustardtools_profile_stats(records):
+    
+    phases = {}
+    for record in records:
+        for phase in record:
+            phases.setdefault(phase, [])
+    for record in records:
+        for phase, values in phases.items():
+            values.append(record.get(phase, 0.))
+    
+    return {phase: {"p50": float(np.percentile(values, 50)) * 1000.,
+                    "p95": float(np.percentile(values, 95)) * 1000.} for phase, values in phases.items()}
+
+def mustardtools_profile_reset():
+    
+    mustardtools_profile_records.clear()
+
+@persistent
+def mustardtools_profile_load(*args):
+    
+    global mustardtools_profile_enabled
+    
+    mustardtools_profile_enabled = bpy.context.scene.mustardtools_settings.ms_profiling
+
+class MUSTARDTOOLS_OT_ProfileExport(bpy.types.Operator):
+    """Export the recorded operator timings to a JSON file"""
+    bl_idname = "mustardui.profile_export"
+    bl_label = "Export"
+    bl_options = {'REGISTER'}
+    
+    filepath: StringProperty(subtype='FILE_PATH',
+        default="mustardtools_profile.json"
     )
     
     @classmethod
     def poll(cls, context):
-        if context.mode != "POSE" or bpy.context.selected_pose_bones == None:
-            return False
-        else:
-            
-            chain_bones = bpy.context.selected_pose_bones
-            
-            if len(chain_bones) < 1:
-                return False
-            else:
-                abort_aa = True
-                for bone in chain_bones:
-                    for constraint in bone.constraints:
-                        if constraint.type == 'IK':
-                            abort_aa = False
-                            break
-                
-                if abort_aa:
-                    return False
-                else:
-                    return True
-
-    def execute(self, context):
         
-        # Import settings
-        settings = bpy.context.scene.mustardtools_settings
-            
-        # Definitions
-        arm = bpy.context.object
-        chain_bones = bpy.context.selected_pose_bones
-        chain_length = len(chain_bones)
-        chain_last_bone = chain_bones[chain_length-1]
-        chain_pole_bone = chain_bones[int((chain_length-1)/2)]
-            
-        removed_constr = 0
-        removed_bones = 0
+        return len(mustardtools_profile_records) > 0
+    
+    def execute(self, context):
         
-        bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+        results = {}
+        for key, records in mustardtools_profile_records.items():
+            results[key] = {"runs": list(records),
+                            "stats_ms": mustardtools_profile_stats(records)}
         
-        if self.reset_bendy:
-            for bone in chain_bones:
-                arm.data.edit_bones[bone.name].bbone_segments = 1
-            arm.data.display_type = "OCTAHEDRAL"
-            if settings.ms_debug:
-                print("MustardTools IK Chain - Bendy bones resetted")
+        with open(bpy.path.abspath(self.filepath), 'w') as f:
+            json.dump(results, f, indent=2)
         
-        bpy.ops.object.mode_set(mode='POSE', toggle=False)
-
-        for bone in chain_bones:
-            for constraint in bone.constraints:
-                if constraint.type == 'IK':
-                    if self.delete_bones:
-                        
-                        bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-                        
-                        if constraint.target != None and constraint.subtarget != None and constraint.subtarget != "":
-                            IKArm = constraint.target
-                            IKBone = IKArm.data.edit_bones[constraint.subtarget]
-                            IKBone_name = IKBone.name
-                            IKArm.data.edit_bones.remove(IKBone)
-                            if settings.ms_debug:
-                                print("MustardTools IK Chain - Bone " + IKBone_name + " removed from Armature " + IKArm.name)
-                            removed_bones = removed_bones + 1
-                        if constraint.pole_target != None and constraint.pole_subtarget != None and constraint.pole_subtarget != "":
-                            IKArm2 = constraint.pole_target
-                            IKBone2 = IKArm2.data.edit_bones[constraint.pole_subtarget]
-                            IKBone2_name = IKBone2.name
-                            IKArm2.data.edit_bones.remove(IKBone2)
-                            if settings.ms_debug:
-                                print("MustardTools IK Chain - Bone " + IKBone2_name + " removed from Armature " + IKArm2.name)
-                            removed_bones = removed_bones + 1
-                        
-                        bpy.ops.object.mode_set(mode='POSE')
-                    
-                    bone.constraints.remove(constraint)
-                    removed_constr = removed_constr + 1
-        if self.delete_bones:
-            self.report({'INFO'}, 'MustardTools - '+ str(removed_constr) +' IK constraints and '+ str(removed_bones) +' Bones successfully removed.')
-        else:
-            self.report({'INFO'}, 'MustardTools - '+ str(removed_constr) +' IK constraints successfully removed.')
+        self.report({'INFO'}, 'MustardTools - Timings of ' + str(len(results)) + ' operators exported.')
         
         return {'FINISHED'}
     
     def invoke(self, context, event):
         
-        return context.window_manager.invoke_props_dialog(self)
-            
-    def draw(self, context):
+        context.window_manager.fileselect_add(self)
         
-        layout = self.layout
+        return {'RUNNING_MODAL'}
+
+class MUSTARDTOOLS_OT_ProfileClear(bpy.types.Operator):
+    """Clear the recorded operator timings"""
+    bl_idname = "mustardui.profile_clear"
+    bl_label = "Clear"
+    bl_options = {'REGISTER'}
+    
+    @classmethod
+    def poll(cls, context):
         
-        chain_bones = bpy.context.selected_pose_bones
+        return len(mustardtools_profile_records) > 0
+    
+    def execute(self, context):
         
-        IK_num = 0
-        IK_num_nMUI = 0
-        for bone in chain_bones:
-            for constraint in bone.constraints:
+        mustardtools_profile_reset()
+        
+        return {'FINISHED'}
+
+# ------------------------------------------------------------------------
+#    Chain resolution
+# ------------------------------------------------------------------------
+#
+# The tools need the chains ordered from the root to the tip, which is not guaranteed by the selection order.
+# The chains are resolved with a parent/children index of the armature bones, built once per armature
+# and invalidated when the armature is edited.
+
+# Index cache, keyed by the armature data pointer. Each entry is a tuple (parents, children),
+# where parents maps each bone name to its parent name (or None), and children maps each bone name to the list of its children names
+mustardtools_chain_index_cache = {}
+
+def mustardtools_chain_index(arm):
+    
+    key = arm.data.as_pointer()
+    
+    # Bones added or removed without an update notification are detected by the bones number
+    index = mustardtools_chain_index_cache.get(key)
+    if index == None or len(index[0]) != len(arm.data.bones):
+        
+        parents = {}
+        children = {}
+        for bone in arm.data.bones:
+            children.setdefault(bone.name, [])
+            if bone.parent != None:
+                parents[bone.name] = bone.parent.name
+                children.setdefault(bone.parent.name, []).append(bone.name)
+            else:
+                parents[bone.name] = None
+        
+        index = (parents, children)
+        mustardtools_chain_index_cache[key] = index
+    
+    return index
+
+def mustardtools_chain_index_invalidate(arm=None):
+    
+    if arm == None:
+        mustardtools_chain_index_cache.clear()
+    else:
+        mustardtools_chain_index_cache.pop(arm.data.as_pointer(), None)
+
+# Selected pose bones of an armature.
+# In multi-object Pose mode the selection also contains the bones of the other armatures, which are excluded
+def mustardtools_selected_pose_bones(arm):
+    
+    bones = bpy.context.selected_pose_bones
+    if bones == None:
+        return []
+    
+    return [bone for bone in bones if bone.id_data == arm]
+
+# Split a set of pose bones in chains, using the armature hierarchy.
+# Every chain is ordered from the root to the tip. A chain ends where a bone has more than one child in the set,
+# and each of the children starts a new chain
+def mustardtools_chains_resolve(arm, bones):
+    
+    parents, children = mustardtools_chain_index(arm)
+    
+    names = [bone.name for bone in bones if bone.id_data == arm]
+    selected = set(names)
+    roots = [name for name in names if parents.get(name) not in selected]
+    
+    chains = []
+    while roots:
+        name = roots.pop(0)
+        chain = [name]
+        while True:
+            selected_children = [child for child in children.get(name, []) if child in selected]
+            if len(selected_children) != 1:
+                break
+            name = selected_children[0]
+            chain.append(name)
+        roots.extend(selected_children)
+        chains.append([arm.pose.bones[name] for name in chain])
+    
+    return chains
+
+# Resolve a set of pose bones as a single chain, ordered from the root to the tip.
+# Returns None if the bones do not form a single chain
+def mustardtools_chain_resolve(arm, bones):
+    
+    chains = mustardtools_chains_resolve(arm, bones)
+    
+    return chains[0] if len(chains) == 1 else None
+
+# Side tokens of symmetric bone names: single letters as suffix or prefix (e.g. Arm.L, Arm_r.001, L_Arm),
+# or whole words, delimited by separators, digits or camel case (e.g. LeftArm, Arm_left, ArmRight.001, LEFT_ARM).
+# Words inside other words (e.g. Bright, Upright, Leftover) are not sides
+mustardtools_mirror_affix = re.compile(r'(?<=[._\- ])[LlRr](?=(?:\.\d+)?$)|^[LlRr](?=[._\- ])')
+mustardtools_mirror_word = re.compile(r'(?:^|(?<=[^A-Za-z])|(?<=[a-z])(?=[A-Z]))(?:Left|Right|left|right)(?![a-z])'
+                                      r'|(?<![A-Za-z])(?:LEFT|RIGHT)(?![A-Za-z])')
+mustardtools_mirror_swap = {"L": "R", "R": "L", "l": "r", "r": "l",
+                            "Left": "Right", "Right": "Left", "left": "right", "right": "left", "LEFT": "RIGHT", "RIGHT": "LEFT"}
+
+def mustardtools_mirror_match(name):
+    
+    match = mustardtools_mirror_affix.search(name)
+    if match == None:
+        matches = list(mustardtools_mirror_word.finditer(name))
+        if len(matches) > 0:
+            match = matches[-1]
+    
+    return match
+
+# Name of the counterpart bone of the other side, or None if the name has no side
+def mustardtools_mirror_name(name):
+    
+    match = mustardtools_mirror_match(name)
+    if match == None:
+        return None
+    
+    return name[:match.start()] + mustardtools_mirror_swap[match.group(0)] + name[match.end():]
+
+# Name with the side (.L or .R) of the reference bone, used for the bones created by the tools on symmetric rigs
+def mustardtools_mirror_side_name(name, reference_name):
+    
+    match = mustardtools_mirror_match(reference_name)
+    if match == None:
+        return name
+    
+    return name + (".L" if match.group(0).lower() in ("l", "left") else ".R")
+
+# Names of the counterpart chain of the other side, or None if the chain has no side or some counterpart bone does not exist.
+# The counterpart bones are looked up in the chain index
+def mustardtools_chain_mirror(arm, chain_names):
+    
+    parents, children = mustardtools_chain_index(arm)
+    
+    mirror = [mustardtools_mirror_name(name) for name in chain_names]
+    if any(name == None or name not in parents for name in mirror):
+        return None
+    
+    return mirror
+
+# Add to a list of chains (bone names) the counterpart chains, if not already in the list or with a constraint of the specified type.
+# The type is the position in the constraints index entries (0 for IK, 2 for Spline IK)
+def mustardtools_chains_mirror(arm, chains, constraint_slot):
+    
+    bones = mustardtools_constraint_index(arm)
+    names = set(name for chain in chains for name in chain)
+    
+    for chain in list(chains):
+        mirror = mustardtools_chain_mirror(arm, chain)
+        if mirror == None or any(name in names for name in mirror):
+            continue
+        if any(bones.get(name, (False, False, False))[constraint_slot] for name in mirror):
+            continue
+        chains.append(mirror)
+        names.update(mirror)
+    
+    return chains
+
+# Names of the bones affected by a constraint with the specified chain count, ordered from the root to the tip
+def mustardtools_chain_constraint_bones(arm, bone_name, chain_count):
+    
+    parents, children = mustardtools_chain_index(arm)
+    
+    chain = [bone_name]
+    while parents.get(chain[-1]) != None and (chain_count == 0 or len(chain) < chain_count):
+        chain.append(parents[chain[-1]])
+    chain.reverse()
+    
+    return chain
+
+# Names of the selected bones, together with the ones of the chains controlled by their constraints of the specified type
+def mustardtools_chain_clean_bones(arm, bones, constraint_type):
+    
+    bones_names = set(bone.name for bone in bones)
+    
+    for bone in bones:
+        for constraint in bone.constraints:
+            if constraint.type == constraint_type:
+                bones_names.update(mustardtools_chain_constraint_bones(arm, bone.name, constraint.chain_count))
+    
+    return bones_names
+
+# ------------------------------------------------------------------------
+#    Constraints index
+# ------------------------------------------------------------------------
+#
+# The poll functions of the IK tools are called at every redraw of the UI.
+# Instead of scanning the constraints of the selected bones every time, a summary of the current selection is cached
+# per armature, so that the poll functions only look it up. The summary is invalidated by the depsgraph updates of the
+# armature data, sent when the bones selection changes, and of the armature object, sent when constraints are added
+# or removed (also from the Blender UI). Pole changes are notified with msgbus, and the tools invalidate it directly.
+# Changes made from Python scripts are seen once the depsgraph is updated (e.g. with bpy.context.view_layer.update()).
+
+# Cache, keyed by the armature object pointer. Each entry is a dictionary with:
+#   - data: pointer of the armature data, used to invalidate the entry on its depsgraph updates
+#   - selection: summary of the selected bones, see mustardtools_constraint_index_selection
+mustardtools_constraint_index_cache = {}
+
+# IK constraints of a pose bone, as a tuple (IK, IK with pole, Spline IK)
+def mustardtools_constraint_flags(pose_bone):
+    
+    ik = False
+    ik_pole = False
+    spline_ik = False
+    for constraint in pose_bone.constraints:
+        if constraint.type == 'IK':
+            ik = True
+            if constraint.pole_target != None and constraint.pole_subtarget != None and constraint.pole_subtarget != "":
+                ik_pole = True
+        elif constraint.type == 'SPLINE_IK':
+            spline_ik = True
+    
+    return (ik, ik_pole, spline_ik)
+
+# IK constraints of all the bones of an armature: for each bone with IK constraints, a tuple (IK, IK with pole, Spline IK).
+# Used by the tools when executed, so it is not cached
+def mustardtools_constraint_index(arm):
+    
+    bones = {}
+    for pose_bone in arm.pose.bones:
+        flags = mustardtools_constraint_flags(pose_bone)
+        if flags[0] or flags[2]:
+            bones[pose_bone.name] = flags
+    
+    return bones
+
+# Summary of the selected bones used by the poll functions, or None if not in Pose mode or nothing is selected
+def mustardtools_constraint_index_selection(context):
+    
+    if context.mode != "POSE" or context.object == None or context.object.type != 'ARMATURE':
+        return None
+    
+    arm = context.object
+    key = arm.as_pointer()
+    index = mustardtools_constraint_index_cache.get(key)
+    
+    if index == None:
+        
+        chain_bones = mustardtools_selected_pose_bones(arm)
+        
+        # Only the constraints of the selected bones are scanned
+        flags = [mustardtools_constraint_flags(bone) for bone in chain_bones]
+        
+        # The Add Pole tool needs an IK constraint without pole on the tip of the selected chain
+        pole_available = False
+        if len(chain_bones) >= 2:
+            chain = mustardtools_chain_resolve(arm, chain_bones)
+            if chain != None:
+                ik, ik_pole, spline_ik = mustardtools_constraint_flags(chain[len(chain)-1])
+                pole_available = ik and not ik_pole
+        
+        index = {"data": arm.data.as_pointer(),
+                "selection": {
+                    "selected_num": len(chain_bones),
+                    "selected_ik": any(ik for ik, ik_pole, spline_ik in flags),
+                    "selected_ik_without_pole": any(ik and not ik_pole for ik, ik_pole, spline_ik in flags),
+                    "selected_spline_ik": any(spline_ik for ik, ik_pole, spline_ik in flags),
+                    "pole_available": pole_available
+                }}
+        mustardtools_constraint_index_cache[key] = index
+    
+    return index["selection"]
+
+def mustardtools_constraint_index_invalidate(arm=None):
+    
+    if arm == None:
+        mustardtools_constraint_index_cache.clear()
+    else:
+        mustardtools_constraint_index_cache.pop(arm.as_pointer(), None)
+
+# Invalidate the summaries of the armatures using an armature data
+def mustardtools_constraint_index_invalidate_data(data):
+    
+    key = data.as_pointer()
+    for arm_key, index in list(mustardtools_constraint_index_cache.items()):
+        if index["data"] == key:
+            del mustardtools_constraint_index_cache[arm_key]
+
+# ------------------------------------------------------------------------
+#    Rig registry
+# ------------------------------------------------------------------------
+#
+# The rigs generated by the tools are recorded on the armature object, so that the Clean tools find the generated
+# bones, curves and empties directly, instead of guessing them from the names and walking the hook modifiers.
+# Curves and empties are stored as pointers, which are not affected by renames. Bones are stored by name, and are also
+# tagged with a custom property (which follows the bone when renamed), used to update the names of renamed bones.
+
+# Bone of a generated rig, with its role in the rig:
+#   - CHAIN: bone of the chain controlled by the rig
+#   - CONSTRAINT: bone of the chain with the rig constraint
+#   - CONTROLLER: controller bone
+#   - POLE: pole bone
+class MustardTools_RigBone(bpy.types.PropertyGroup):
+    
+    role: bpy.props.StringProperty(default="")
+
+class MustardTools_RigObject(bpy.types.PropertyGroup):
+    
+    object: bpy.props.PointerProperty(type=bpy.types.Object)
+
+class MustardTools_Rig(bpy.types.PropertyGroup):
+    
+    rig_id: bpy.props.StringProperty(default="")
+    rig_type: bpy.props.EnumProperty(items = [('IK_CHAIN','IK Chain','IK rig generated by the IK Chain tool'),
+                                            ('IK_SPLINE','IK Spline','Spline IK rig generated by the IK Spline tool')],
+                                    default = 'IK_CHAIN')
+    bones: bpy.props.CollectionProperty(type=MustardTools_RigBone)
+    curve: bpy.props.PointerProperty(type=bpy.types.Object)
+    empties: bpy.props.CollectionProperty(type=MustardTools_RigObject)
+    # Fit Curve setting used for the curve of IK Spline rigs
+    fit: bpy.props.BoolProperty(default=False)
+
+bpy.utils.register_class(MustardTools_RigBone)
+bpy.utils.register_class(MustardTools_RigObject)
+bpy.utils.register_class(MustardTools_Rig)
+
+bpy.types.Object.mustardtools_rigs = bpy.props.CollectionProperty(type=MustardTools_Rig)
+
+# Name of the custom property used to tag the bones of a rig
+def mustardtools_rig_key(rig_id):
+    
+    return "MustardTools.Rig." + rig_id
+
+def mustardtools_rig_new(arm, rig_type):
+    
+    rig = arm.mustardtools_rigs.add()
+    rig.rig_id = uuid.uuid4().hex
+    rig.rig_type = rig_type
+    
+    return rig
+
+# Record a bone in the rig. Should be called in Pose or Object mode
+def mustardtools_rig_add_bone(arm, rig, bone_name, role):
+    
+    item = rig.bones.add()
+    item.name = bone_name
+    item.role = role
+    arm.data.bones[bone_name][mustardtools_rig_key(rig.rig_id)] = role
+
+def mustardtools_rig_add_object(rig, obj):
+    
+    item = rig.empties.add()
+    item.name = obj.name
+    item.object = obj
+
+def mustardtools_rig_remove_bone(rig, bone_name):
+    
+    for i, item in enumerate(rig.bones):
+        if item.name == bone_name:
+            rig.bones.remove(i)
+            break
+
+def mustardtools_rig_get(arm, rig_id):
+    
+    for rig in arm.mustardtools_rigs:
+        if rig.rig_id == rig_id:
+            return rig
+    
+    return None
+
+# Update the bone names recorded in the rig from the bone tags, if some bone has been renamed or removed
+def mustardtools_rig_refresh(arm, rig):
+    
+    key = mustardtools_rig_key(rig.rig_id)
+    bones = arm.data.bones
+    
+    if all(item.name in bones and bones[item.name].get(key) == item.role for item in rig.bones):
+        return
+    
+    tagged = [(bone.name, bone[key]) for bone in bones if key in bone]
+    
+    rig.bones.clear()
+    for bone_name, role in tagged:
+        item = rig.bones.add()
+        item.name = bone_name
+        item.role = role
+
+# Names of the bones of the rig with the specified roles
+def mustardtools_rig_bones(rig, roles):
+    
+    return [item.name for item in rig.bones if item.role in roles]
+
+# Rig generated with the constraint on the bone, or None if the constraint was not generated by the tools.
+# The constraint is matched using its targets, which are kept updated by Blender when renaming bones and objects.
+# Set refresh to False when writing properties is not allowed (e.g. in draw functions)
+def mustardtools_rig_find(arm, bone_name, constraint, refresh=True):
+    
+    for rig in arm.mustardtools_rigs:
+        
+        if (rig.rig_type == 'IK_CHAIN') != (constraint.type == 'IK'):
+            continue
+        
+        if refresh:
+            mustardtools_rig_refresh(arm, rig)
+        
+        if bone_name not in mustardtools_rig_bones(rig, ('CONSTRAINT',)):
+            continue
+        
+        if rig.rig_type == 'IK_CHAIN':
+            if constraint.target == arm and constraint.subtarget in mustardtools_rig_bones(rig, ('CONTROLLER',)):
+                return rig
+        elif rig.curve != None and constraint.target == rig.curve:
+            return rig
+    
+    return None
+
+# Remove a rig from the registry, together with the tags of its bones. Should be called in Pose or Object mode
+def mustardtools_rig_remove(arm, rig_id):
+    
+    key = mustardtools_rig_key(rig_id)
+    
+    for i, rig in enumerate(arm.mustardtools_rigs):
+        if rig.rig_id == rig_id:
+            for item in rig.bones:
+                bone = arm.data.bones.get(item.name)
+                if bone != None and key in bone:
+                    del bone[key]
+            arm.mustardtools_rigs.remove(i)
+            break
+
+# ------------------------------------------------------------------------
+#    IK Chain Tool
+# ------------------------------------------------------------------------
+
+class MUSTARDTOOLS_OT_IKChain(bpy.types.Operator):
+    """This tool will create an IK rig on the selected chain.\nSelect the bones of the chain in any order: the controller will be placed on the tip of the chain.\n\nConditions:\n    - select at least 3 bones\n    - the selected bones should be a single connected chain, unless Multiple Chains is enabled"""
+    bl_idname = "mustardui.ik_chain"
+    bl_label = "Create"
+    bl_options = {'REGISTER','UNDO'}
+    
+    @classmethod
+    def poll(cls, context):
+        
+        selection = mustardtools_constraint_index_selection(context)
+        
+        return selection != None and selection["selected_num"] >= 2 and not selection["selected_ik"]
+
+    @mustardtools_profile
+    def execute(self, context):
+        
+        # Import settings
+        settings = bpy.context.scene.mustardtools_settings
+        name_prefix = settings.ms_naming_prefix
+        
+        IKChainControllerBoneName = name_prefix + ".IK.Controller"
+        IKChainConstraintName = name_prefix + " IKChain"
+    
+        # Definitions
+        arm = bpy.context.object
+        if settings.ik_chain_multi:
+            chains = mustardtools_chains_resolve(arm, mustardtools_selected_pose_bones(arm))
+        else:
+            chain = mustardtools_chain_resolve(arm, mustardtools_selected_pose_bones(arm))
+            if chain == None:
+                self.report({'ERROR'}, 'MustardTools - The selected bones are not a single chain. Enable Multiple Chains to rig more chains.')
+                return {'CANCELLED'}
+            chains = [chain]
+        
+        # Save the names, as changing mode will erase the bone data
+        chains = [[bone.name for bone in chain] for chain in chains if len(chain) >= 2]
+        
+        if len(chains) == 0:
+            self.report({'ERROR'}, 'MustardTools - No chain with at least 2 bones found in the selection.')
+            return {'CANCELLED'}
+        
+        # The counterpart chains are rigged in the same passes
+        if settings.ik_chain_symmetry:
+            mustardtools_chains_mirror(arm, chains, 0)
+
+        mustardtools_log_ik_chain.debug("Armature selected: %s", arm.name)
+        for chain in chains:
+            mustardtools_log_ik_chain.debug("Chain length: %d, last bone: %s", len(chain), chain[-1])
+        
+        # Create all the controller bones in a single Edit mode pass
+        mustardtools_mode_set('EDIT')
+        
+        # List of (bone with the constraint, controller bone, chain length, chain)
+        IK_rigs = []
+        
+        with mustardtools_profile_phase("Bone creation"):
+            for chain in chains:
+                
+                chain_length = len(chain)
+                chain_last_bone_name = chain[chain_length-1]
+                
+                if settings.ik_chain_bendy:
+                    for bone_name in chain:
+                        arm.data.edit_bones[bone_name].bbone_segments = settings.ik_chain_bendy_segments
+                    if settings.ik_chain_last_bone_use:
+                        arm.data.edit_bones[chain_last_bone_name].bbone_segments = 1
+                
+                if settings.ik_chain_last_bone_use:
+                    
+                    IK_main_bone_edit = arm.data.edit_bones[chain_last_bone_name]
+                    IK_main_bone_edit.parent = None
+                    IK_main_bone_edit.use_deform = False
+                    IK_rigs.append((chain[chain_length-2], IK_main_bone_edit.name, chain_length - 1, chain))
+                
+                else:
+                    
+                    chain_last_bone_edit = arm.data.edit_bones[chain_last_bone_name]
+                    if settings.ik_chain_symmetry:
+                        IK_main_bone_edit = arm.data.edit_bones.new(mustardtools_mirror_side_name(IKChainControllerBoneName, chain_last_bone_name))
+                    else:
+                        IK_main_bone_edit = arm.data.edit_bones.new(IKChainControllerBoneName)
+                    IK_main_bone_edit.use_deform = False
+                    IK_main_bone_edit.head = chain_last_bone_edit.tail
+                    IK_main_bone_edit.tail = 2. * chain_last_bone_edit.tail - chain_last_bone_edit.head
+                    IK_rigs.append((chain_last_bone_name, IK_main_bone_edit.name, chain_length, chain))
+            
+        if settings.ik_chain_bendy:
+            arm.data.display_type = "BBONE"
+
+        # Create all the constraints in a single Pose mode pass
+        mustardtools_mode_set('POSE')
+        mustardtools_chain_index_invalidate(arm)
+        
+        with mustardtools_profile_phase("Constraints"):
+            for chain_last_bone_name, IK_main_bone_name, chain_length, chain in IK_rigs:
+                
+                IK_main_bone = arm.pose.bones[IK_main_bone_name]
+                IK_main_bone.custom_shape = settings.ik_chain_last_bone_custom_shape
+                IK_main_bone.use_custom_shape_bone_size = True
+                
+                IKConstr = arm.pose.bones[chain_last_bone_name].constraints.new('IK')
+                IKConstr.name = IKChainConstraintName
+                IKConstr.use_rotation = True
+                IKConstr.target = arm
+                IKConstr.subtarget = IK_main_bone_name
+                IKConstr.chain_count = chain_length
+                
+                # Record the rig in the registry
+                rig = mustardtools_rig_new(arm, 'IK_CHAIN')
+                for bone_name in chain[:chain_length-1]:
+                    mustardtools_rig_add_bone(arm, rig, bone_name, 'CHAIN')
+                mustardtools_rig_add_bone(arm, rig, chain_last_bone_name, 'CONSTRAINT')
+                mustardtools_rig_add_bone(arm, rig, IK_main_bone_name, 'CONTROLLER')
+
+        if len(IK_rigs) > 1:
+            self.report({'INFO'}, 'MustardTools - ' + str(len(IK_rigs)) + ' IK successfully added.')
+        else:
+            self.report({'INFO'}, 'MustardTools - IK successfully added.')
+        
+        mustardtools_constraint_index_invalidate(arm)
+        
+        return {'FINISHED'}
+
+# Position of the pole of an IK chain, in the bend plane of the chain, at the specified distance from the joint where the chain bends the most.
+# heads are the heads of the chain bones and tip is the tail of the last bone, in armature space.
+# If the chain is straight, the pole is placed on the middle of the chain, along the fallback axis
+def mustardtools_ik_pole_position(heads, tip, distance, fallback_axis):
+    
+    root = heads[0]
+    axis = (tip - root).normalized()
+    
+    joint = None
+    offset = None
+    for head in heads[1:]:
+        head_offset = (head - root) - axis * (head - root).dot(axis)
+        if offset == None or head_offset.length > offset.length:
+            joint = head
+            offset = head_offset
+    
+    if offset == None or offset.length < 1e-4 * (tip - root).length:
+        joint = (root + tip) / 2.
+        offset = fallback_axis - axis * fallback_axis.dot(axis)
+    
+    return joint + offset.normalized() * distance
+
+# Pole angle that keeps an IK chain in its rest position, with the pole in the specified position.
+# The pole angle is the angle between the X axis of the first bone of the chain and the direction of the pole,
+# projected on the plane orthogonal to the first bone. All the positions are in armature space.
+# The signed angle is computed with atan2, which also works when the pole is aligned with the chain (zero length vectors)
+def mustardtools_ik_pole_angle(base_head, base_tail, base_x_axis, ik_tail, pole_location):
+    
+    base_axis = base_tail - base_head
+    pole_normal = (ik_tail - base_head).cross(pole_location - base_head)
+    projected_pole_axis = pole_normal.cross(base_axis)
+    
+    return - math.atan2(base_x_axis.cross(projected_pole_axis).dot(base_axis.normalized()), base_x_axis.dot(projected_pole_axis))
+
+class MUSTARDTOOLS_OT_IKChain_Pole(bpy.types.Operator):
+    """This tool will guide you in the creation of a pole for an already available IK rig.\nFor a better automatic generation, select the same chain you used to generate the IK Chain rig"""
+    bl_idname = "mustardui.ik_chainpole"
+    bl_label = "Add Pole"
+    bl_options = {'REGISTER','UNDO'}
+    
+    status: BoolProperty(name='',
+        description="",
+        default=True,
+        options={'HIDDEN'}
+    )
+    cancel: BoolProperty(name='',
+        description="",
+        default=False,
+        options={'HIDDEN'}
+    )
+    
+    @classmethod
+    def poll(cls, context):
+        
+        settings = bpy.context.scene.mustardtools_settings
+        
+        if settings.ik_chain_pole_auto:
+            
+            selection = mustardtools_constraint_index_selection(context)
+            
+            return selection != None and selection["selected_ik_without_pole"]
+        
+        elif not settings.ik_chain_pole_status:
+            
+            selection = mustardtools_constraint_index_selection(context)
+            
+            return selection != None and selection["pole_available"]
+                    
+        else:
+            
+            return True
+
+    @mustardtools_profile
+    def execute(self, context):
+        
+        # Import settings
+        settings = bpy.context.scene.mustardtools_settings
+        
+        if settings.ik_chain_pole_auto:
+            return self.execute_auto(context)
+        
+        name_prefix = settings.ms_naming_prefix
+        
+        # Naming convention
+        IKChain_Pole_Bone_Name = name_prefix + ".IK.Pole"
+    
+        # Definitions
+        arm = bpy.context.object
+        
+        if self.cancel and self.status:
+                
+            IK_pole_bone_edit = arm.data.edit_bones[settings.ik_chain_pole_bone]
+            arm.data.edit_bones.remove(IK_pole_bone_edit)
+                
+            mustardtools_mode_set('POSE')
+                
+            self.cancel = False
+            self.status = False
+            settings.ik_chain_pole_status = False
+        
+        elif self.status and not self.cancel:
+            
+            # Definitions
+            chain_bones = mustardtools_chain_resolve(arm, mustardtools_selected_pose_bones(arm))
+            if chain_bones == None:
+                self.report({'ERROR'}, 'MustardTools - The selected bones are not a single chain.')
+                return {'CANCELLED'}
+            chain_length = len(chain_bones)
+            chain_last_bone = chain_bones[chain_length-1]
+            chain_pole_bone = chain_bones[int((chain_length-1)/2)]
+            
+            settings.ik_chain_pole_status = True
+            
+            mustardtools_log_ik_chain.debug("Armature selected: %s", arm.name)
+            mustardtools_log_ik_chain.debug("Chain length: %d, last bone: %s, pole bone reference: %s", chain_length, chain_last_bone.name, chain_pole_bone.name)
+            
+            settings.ik_chain_last_bone = chain_last_bone.name
+        
+            mustardtools_mode_set('EDIT')
+    
+            chain_pole_bone_edit = arm.data.edit_bones[chain_pole_bone.name]
+            if settings.ik_chain_symmetry:
+                IK_pole_bone_edit = arm.data.edit_bones.new(mustardtools_mirror_side_name(IKChain_Pole_Bone_Name, chain_last_bone.name))
+            else:
+                IK_pole_bone_edit = arm.data.edit_bones.new(IKChain_Pole_Bone_Name)
+            IK_pole_bone_edit.use_deform = False
+            IK_pole_bone_edit.head = chain_pole_bone_edit.head
+            IK_pole_bone_edit.tail = chain_pole_bone_edit.tail
+            
+            settings.ik_chain_pole_bone = IK_pole_bone_edit.name
+            
+            bpy.ops.armature.select_all(action='DESELECT')
+            IK_pole_bone_edit.select = True
+            IK_pole_bone_edit.select_head = True
+            IK_pole_bone_edit.select_tail = True
+            arm.data.edit_bones.active = IK_pole_bone_edit
+            
+            mustardtools_log_ik_chain.debug("Pole bone %s created, waiting for confirmation", IK_pole_bone_edit.name)
+            
+        else:
+            
+            # List of (bone with the IK constraint, pole bone)
+            IK_poles = [(settings.ik_chain_last_bone, settings.ik_chain_pole_bone)]
+            
+            # Mirror the pole on the counterpart chain, if it has an IK constraint without pole.
+            # The mirrored pole is created while still in Edit mode, so no additional mode switch is needed
+            if settings.ik_chain_symmetry:
+                
+                mirror_last_bone = mustardtools_mirror_name(settings.ik_chain_last_bone)
+                ik, ik_pole, spline_ik = mustardtools_constraint_index(arm).get(mirror_last_bone, (False, False, False))
+                
+                if ik and not ik_pole:
+                    
+                    mustardtools_mode_set('EDIT')
+                    
+                    IK_pole_bone_edit = arm.data.edit_bones[settings.ik_chain_pole_bone]
+                    mirror_pole_name = mustardtools_mirror_name(IK_pole_bone_edit.name)
+                    IK_mirror_pole_bone_edit = arm.data.edit_bones.new(mirror_pole_name if mirror_pole_name != None else IKChain_Pole_Bone_Name)
+                    IK_mirror_pole_bone_edit.use_deform = False
+                    IK_mirror_pole_bone_edit.head = Vector((-IK_pole_bone_edit.head.x, IK_pole_bone_edit.head.y, IK_pole_bone_edit.head.z))
+                    IK_mirror_pole_bone_edit.tail = Vector((-IK_pole_bone_edit.tail.x, IK_pole_bone_edit.tail.y, IK_pole_bone_edit.tail.z))
+                    IK_mirror_pole_bone_edit.roll = - IK_pole_bone_edit.roll
+                    
+                    IK_poles.append((mirror_last_bone, IK_mirror_pole_bone_edit.name))
+            
+            mustardtools_mode_set('POSE')
+            
+            for IK_last_bone_name, IK_pole_bone_name in IK_poles:
+                
+                IK_pole_bone = arm.pose.bones[IK_pole_bone_name]
+                IK_pole_bone.custom_shape = settings.ik_chain_pole_bone_custom_shape
+                IK_pole_bone.use_custom_shape_bone_size = True
+                
+                for constraint in arm.pose.bones[IK_last_bone_name].constraints:
+                    if constraint.type == 'IK':
+                        IKConstr = constraint
+                
+                IKConstr.use_rotation = True
+                IKConstr.pole_target = arm
+                IKConstr.pole_subtarget = IK_pole_bone_name
+                IKConstr.pole_angle = settings.ik_chain_pole_angle * 3.141593/ 180.
+                
+                # Record the pole in the registry, if the IK was generated by the tools
+                rig = mustardtools_rig_find(arm, IK_last_bone_name, IKConstr)
+                if rig != None:
+                    mustardtools_rig_add_bone(arm, rig, IK_pole_bone_name, 'POLE')
+            
+            settings.ik_chain_pole_status = False
+            
+            if len(IK_poles) > 1:
+                self.report({'INFO'}, 'MustardTools - ' + str(len(IK_poles)) + ' IK poles successfully added.')
+            else:
+                self.report({'INFO'}, 'MustardTools - IK pole successfully added.')
+        
+        mustardtools_constraint_index_invalidate(arm)
+        
+        return {'FINISHED'}
+
+    # Non-interactive pole creation, for all the selected IK constraints without pole
+    def execute_auto(self, context):
+        
+        # Import settings
+        settings = bpy.context.scene.mustardtools_settings
+        name_prefix = settings.ms_naming_prefix
+        
+        # Naming convention
+        IKChain_Pole_Bone_Name = name_prefix + ".IK.Pole"
+        
+        # Definitions
+        arm = bpy.context.object
+        bones = mustardtools_constraint_index(arm)
+        
+        # Bones with an IK constraint without pole
+        IK_bones = [bone.name for bone in mustardtools_selected_pose_bones(arm) if bone.name in bones and not bones[bone.name][1]]
+        if settings.ik_chain_symmetry:
+            for bone_name in list(IK_bones):
+                mirror_name = mustardtools_mirror_name(bone_name)
+                if mirror_name != None and mirror_name not in IK_bones and mirror_name in bones and not bones[mirror_name][1]:
+                    IK_bones.append(mirror_name)
+        
+        # Compute the poles from the rest position of the chains
+        # List of (bone with the IK constraint, pole head, pole tail, pole angle)
+        IK_poles = []
+        
+        with mustardtools_profile_phase("Pole computation"):
+            for bone_name in IK_bones:
+                
+                for constraint in arm.pose.bones[bone_name].constraints:
+                    if constraint.type == 'IK':
+                        IKConstr = constraint
+                
+                chain = [arm.data.bones[name] for name in mustardtools_chain_constraint_bones(arm, bone_name, IKConstr.chain_count)]
+                chain_size = sum(bone.length for bone in chain)
+                base_bone = chain[0]
+                base_x_axis = base_bone.matrix_local.col[0].to_3d()
+                
+                pole_head = mustardtools_ik_pole_position([bone.head_local for bone in chain], chain[-1].tail_local,
+                                                            settings.ik_chain_pole_distance * chain_size,
+                                                            base_bone.matrix_local.col[2].to_3d())
+                
+                # The pole bone is parallel to the middle bone of the chain
+                pole_reference = chain[int((len(chain)-1)/2)]
+                pole_tail = pole_head + (pole_reference.tail_local - pole_reference.head_local)
+                
+                pole_angle = mustardtools_ik_pole_angle(base_bone.head_local, base_bone.tail_local, base_x_axis, chain[-1].tail_local, pole_head)
+                
+                IK_poles.append((bone_name, pole_head, pole_tail, pole_angle))
+                
+                mustardtools_log_ik_chain.debug("Pole for %s placed at: %.4f, %.4f, %.4f, pole angle: %.2f", bone_name, pole_head.x, pole_head.y, pole_head.z, math.degrees(pole_angle))
+            
+        # Create all the pole bones in a single Edit mode pass
+        mustardtools_mode_set('EDIT')
+        
+        with mustardtools_profile_phase("Bone creation"):
+            IK_poles_names = []
+            for bone_name, pole_head, pole_tail, pole_angle in IK_poles:
+                if settings.ik_chain_symmetry:
+                    IK_pole_bone_edit = arm.data.edit_bones.new(mustardtools_mirror_side_name(IKChain_Pole_Bone_Name, bone_name))
+                else:
+                    IK_pole_bone_edit = arm.data.edit_bones.new(IKChain_Pole_Bone_Name)
+                IK_pole_bone_edit.use_deform = False
+                IK_pole_bone_edit.head = pole_head
+                IK_pole_bone_edit.tail = pole_tail
+                IK_poles_names.append(IK_pole_bone_edit.name)
+            
+        # Set all the poles in a single Pose mode pass
+        mustardtools_mode_set('POSE')
+        mustardtools_chain_index_invalidate(arm)
+        
+        with mustardtools_profile_phase("Constraints"):
+            for (bone_name, pole_head, pole_tail, pole_angle), IK_pole_bone_name in zip(IK_poles, IK_poles_names):
+                
+                IK_pole_bone = arm.pose.bones[IK_pole_bone_name]
+                IK_pole_bone.custom_shape = settings.ik_chain_pole_bone_custom_shape
+                IK_pole_bone.use_custom_shape_bone_size = True
+                
+                for constraint in arm.pose.bones[bone_name].constraints:
+                    if constraint.type == 'IK':
+                        IKConstr = constraint
+                
+                IKConstr.use_rotation = True
+                IKConstr.pole_target = arm
+                IKConstr.pole_subtarget = IK_pole_bone_name
+                IKConstr.pole_angle = pole_angle
+                
+                # Record the pole in the registry, if the IK was generated by the tools
+                rig = mustardtools_rig_find(arm, bone_name, IKConstr)
+                if rig != None:
+                    mustardtools_rig_add_bone(arm, rig, IK_pole_bone_name, 'POLE')
+            
+        if len(IK_poles) > 1:
+            self.report({'INFO'}, 'MustardTools - ' + str(len(IK_poles)) + ' IK poles successfully added.')
+        else:
+            self.report({'INFO'}, 'MustardTools - IK pole successfully added.')
+        
+        mustardtools_constraint_index_invalidate(arm)
+        
+        return {'FINISHED'}
+
+class MUSTARDTOOLS_OT_IKChain_Clean(bpy.types.Operator):
+    """This tool will clean the available IK constraints in the selected bones.\nSelect a bone with an IK constraint to enable the tool.\nA confirmation box will appear"""
+    bl_idname = "mustardui.ik_chainclean"
+    bl_label = "Remove IK"
+    bl_options = {'REGISTER','UNDO'}
+    
+    delete_bones: BoolProperty(name='Delete bones',
+        description="Delete controller and pole bones",
+        default=True
+    )
+    reset_bendy: BoolProperty(name='Reset Bendy Bones',
+        description="Reset bendy bones to standard bones",
+        default=True
+    )
+    
+    @classmethod
+    def poll(cls, context):
+        
+        selection = mustardtools_constraint_index_selection(context)
+        
+        return selection != None and selection["selected_ik"]
+
+    @mustardtools_profile
+    def execute(self, context):
+        
+        # Definitions
+        arm = bpy.context.object
+        chain_bones = mustardtools_selected_pose_bones(arm)
+        
+        # Bendy bones are reset on all the bones of the chains controlled by the constraints
+        reset_bones = mustardtools_chain_clean_bones(arm, chain_bones, 'IK')
+        
+        with mustardtools_profile_phase("Constraints"):
+            # Collect the constraints, controller and pole bones in a single Pose mode scan.
+            # The bones of the rigs generated by the tools are found in the registry, the other ones from the constraint targets
+            constraints = []
+            bones = set()
+            rigs = []
+            
+            for bone in chain_bones:
+                for constraint in bone.constraints:
+                    if constraint.type == 'IK':
+                        constraints.append((bone.name, constraint.name))
+                        rig = mustardtools_rig_find(arm, bone.name, constraint)
+                        if rig != None:
+                            rigs.append(rig.rig_id)
+                            bones.update((arm.name, bone_name) for bone_name in mustardtools_rig_bones(rig, ('CONTROLLER', 'POLE')))
+                            continue
+                        if constraint.target != None and constraint.subtarget != None and constraint.subtarget != "":
+                            bones.add((constraint.target.name, constraint.subtarget))
+                        if constraint.pole_target != None and constraint.pole_subtarget != None and constraint.pole_subtarget != "":
+                            bones.add((constraint.pole_target.name, constraint.pole_subtarget))
+            
+            # Remove the constraints (not while iterating on them)
+            for bone_name, constraint_name in constraints:
+                bone = arm.pose.bones[bone_name]
+                bone.constraints.remove(bone.constraints[constraint_name])
+            
+        removed_constr = len(constraints)
+        removed_bones = 0
+        
+        # Reset bendy bones and remove the controller and pole bones in a single Edit mode pass
+        mustardtools_mode_set('EDIT')
+        
+        with mustardtools_profile_phase("Bone removal"):
+            if self.reset_bendy:
+                for bone_name in reset_bones:
+                    arm.data.edit_bones[bone_name].bbone_segments = 1
+                arm.data.display_type = "OCTAHEDRAL"
+                mustardtools_log_ik_chain.debug("Bendy bones reset on %d bones", len(reset_bones))
+            
+            if self.delete_bones:
+                for arm_name, bone_name in bones:
+                    # Only the bones of the armature in Edit mode can be removed
+                    if arm_name != arm.name or bone_name not in arm.data.edit_bones:
+                        continue
+                    arm.data.edit_bones.remove(arm.data.edit_bones[bone_name])
+                    removed_bones = removed_bones + 1
+                    mustardtools_log_ik_chain.debug("Bone %s removed from Armature %s", bone_name, arm.name)
+            
+        mustardtools_mode_set('POSE')
+        mustardtools_chain_index_invalidate(arm)
+        
+        for rig_id in rigs:
+            mustardtools_rig_remove(arm, rig_id)
+        
+        if self.delete_bones:
+            self.report({'INFO'}, 'MustardTools - '+ str(removed_constr) +' IK constraints and '+ str(removed_bones) +' Bones successfully removed.')
+        else:
+            self.report({'INFO'}, 'MustardTools - '+ str(removed_constr) +' IK constraints successfully removed.')
+        
+        mustardtools_constraint_index_invalidate(arm)
+        
+        return {'FINISHED'}
+    
+    def invoke(self, context, event):
+        
+        return context.window_manager.invoke_props_dialog(self)
+            
+    def draw(self, context):
+        
+        layout = self.layout
+        
+        arm = bpy.context.object
+        chain_bones = mustardtools_selected_pose_bones(arm)
+        
+        IK_num = 0
+        IK_num_nMUI = 0
+        for bone in chain_bones:
+            for constraint in bone.constraints:
                 if constraint.type == 'IK':
                     IK_num = IK_num + 1
-                    if "MustardTools" not in constraint.name:
+                    if mustardtools_rig_find(arm, bone.name, constraint, refresh=False) == None:
                         IK_num_nMUI = IK_num_nMUI + 1
         
         box = layout.box()
@@ -488,12 +1440,497 @@ class MUSTARDTOOLS_OT_IKChain_Clean(bpy.types.Operator):
         box.label(text="        - " + str(IK_num_nMUI) + " of which are not Mustard Tools generated.")
 
 
+class MUSTARDTOOLS_OT_IKChain_Rebuild(bpy.types.Operator):
+    """This tool will update the IK rigs of the selected bones to the current settings (bendy bones and custom shapes), without creating them again.\nSelect a bone with an IK constraint generated by Mustard Tools to enable the tool"""
+    bl_idname = "mustardui.ik_chainrebuild"
+    bl_label = "Rebuild"
+    bl_options = {'REGISTER','UNDO'}
+    
+    @classmethod
+    def poll(cls, context):
+        
+        selection = mustardtools_constraint_index_selection(context)
+        
+        return selection != None and selection["selected_ik"]
+
+    @mustardtools_profile
+    def execute(self, context):
+        
+        settings = bpy.context.scene.mustardtools_settings
+        
+        arm = bpy.context.object
+        bbone_segments = settings.ik_chain_bendy_segments if settings.ik_chain_bendy else 1
+        
+        rigs = 0
+        updated = 0
+        
+        # Only the properties different from the settings are updated, so no mode switch is needed
+        for bone in mustardtools_selected_pose_bones(arm):
+            for constraint in bone.constraints:
+                
+                if constraint.type != 'IK':
+                    continue
+                rig = mustardtools_rig_find(arm, bone.name, constraint)
+                if rig == None:
+                    continue
+                rigs = rigs + 1
+                
+                for bone_name in mustardtools_rig_bones(rig, ('CHAIN', 'CONSTRAINT')):
+                    data_bone = arm.data.bones[bone_name]
+                    if data_bone.bbone_segments != bbone_segments:
+                        data_bone.bbone_segments = bbone_segments
+                        updated = updated + 1
+                
+                for roles, shape in [(('CONTROLLER',), settings.ik_chain_last_bone_custom_shape),
+                                    (('POLE',), settings.ik_chain_pole_bone_custom_shape)]:
+                    for bone_name in mustardtools_rig_bones(rig, roles):
+                        pose_bone = arm.pose.bones[bone_name]
+                        if pose_bone.custom_shape != shape:
+                            pose_bone.custom_shape = shape
+                            pose_bone.use_custom_shape_bone_size = True
+                            updated = updated + 1
+        
+        if rigs == 0:
+            self.report({'WARNING'}, 'MustardTools - No IK rig generated by Mustard Tools found in the selected bones.')
+            return {'CANCELLED'}
+        
+        if settings.ik_chain_bendy:
+            arm.data.display_type = "BBONE"
+        
+        self.report({'INFO'}, 'MustardTools - ' + str(rigs) + ' IK rigs rebuilt, ' + str(updated) + ' Bones updated.')
+        
+        return {'FINISHED'}
+
 # ------------------------------------------------------------------------
 #    IK Spline Tool
 # ------------------------------------------------------------------------
 
+# Indices of the chain bones where the controllers are placed (evenly spaced, the last one on the tip of the chain)
+def mustardtools_ik_spline_controllers(chain_length, num):
+    
+    return [int(chain_length/(num-1)*i) for i in range(0,num-1)] + [chain_length-1]
+
+# Transform armature space positions to world space, with a single batched matrix multiplication
+def mustardtools_ik_spline_world_points(matrix_world, positions):
+    
+    matrix = np.array(matrix_world)
+    points = np.array([tuple(position) for position in positions])
+    
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+# Positions of a chain used to build an IK spline rig, from the current pose of the bones.
+# Returns the heads and tails of the chain bones in armature space, and the chain points (bone heads and the tail of the last bone)
+# transformed with matrix. Creation and Rebuild both use this, so that an unchanged chain gives the same rig
+def mustardtools_ik_spline_chain(arm, chain_names, matrix):
+    
+    chain_heads = [arm.pose.bones[bone_name].head.copy() for bone_name in chain_names]
+    chain_tails = [arm.pose.bones[bone_name].tail.copy() for bone_name in chain_names]
+    chain_points = mustardtools_ik_spline_world_points(matrix, chain_heads + [chain_tails[-1]])
+    
+    return chain_heads, chain_tails, chain_points
+
+# Unit tangent of the chain at a controller index, estimated from the neighbouring chain points
+def mustardtools_ik_spline_fit_tangent(points, index):
+    
+    tangent = points[min(index+1, len(points)-1)] - points[max(index-1, 0)]
+    
+    return tangent / max(np.linalg.norm(tangent), 1e-8)
+
+# Least-squares fit of the Bezier segment between the chain points at the controllers indices a and b.
+# The handles are aligned with the chain tangents at the controllers, and their lengths are computed with a least-squares fit
+# on all the chain points in the segment. Returns the right handle of a and the left handle of b
+def mustardtools_ik_spline_fit_segment(points, a, b):
+    
+    p0 = points[a]
+    p3 = points[b]
+    t1 = mustardtools_ik_spline_fit_tangent(points, a)
+    t2 = - mustardtools_ik_spline_fit_tangent(points, b)
+    
+    segment_length = float(np.linalg.norm(p3 - p0))
+    alpha1 = alpha2 = segment_length / 3.
+    
+    # Chord-length parametrization of the chain points in the segment
+    data = points[a:b+1]
+    distances = np.zeros(len(data))
+    distances[1:] = np.cumsum(np.linalg.norm(np.diff(data, axis=0), axis=1))
+    
+    if len(data) > 2 and distances[-1] > 0.:
+        
+        t = (distances / distances[-1])[:, None]
+        b0 = (1-t)**3
+        b1 = 3 * (1-t)**2 * t
+        b2 = 3 * (1-t) * t**2
+        b3 = t**3
+        
+        a1 = b1 * t1
+        a2 = b2 * t2
+        rest = data - (b0 + b1) * p0 - (b2 + b3) * p3
+        
+        c = np.array([[np.sum(a1 * a1), np.sum(a1 * a2)],
+                      [np.sum(a1 * a2), np.sum(a2 * a2)]])
+        x = np.array([np.sum(a1 * rest), np.sum(a2 * rest)])
+        
+        # Fall back to the default lengths if the system is degenerate or gives handles pointing backwards
+        if abs(np.linalg.det(c)) > 1e-12:
+            alpha = np.linalg.solve(c, x)
+            if alpha[0] > 1e-6 * segment_length and alpha[1] > 1e-6 * segment_length:
+                alpha1, alpha2 = float(alpha[0]), float(alpha[1])
+    
+    return p0 + alpha1 * t1, p3 + alpha2 * t2
+
+# Least-squares fit of a Bezier curve passing through the chain points at the controllers indices.
+# points are the heads of the chain bones followed by the tail of the last bone.
+# Each segment is fitted with mustardtools_ik_spline_fit_segment, so that the handles are aligned.
+# Returns the arrays of points, left handles and right handles
+def mustardtools_ik_spline_fit(points, controllers):
+    
+    num = len(controllers)
+    co = points[controllers]
+    
+    handle_left = np.empty((num, 3))
+    handle_right = np.empty((num, 3))
+    
+    for i in range(0, num-1):
+        handle_right[i], handle_left[i+1] = mustardtools_ik_spline_fit_segment(points, controllers[i], controllers[i+1])
+    
+    # The outer handles of the first and last points are mirrored
+    handle_left[0] = 2 * co[0] - handle_right[0]
+    handle_right[num-1] = 2 * co[num-1] - handle_left[num-1]
+    
+    return co, handle_left, handle_right
+
+# AUTO handles computed by Blender for a Bezier point between the points prev and next.
+# At the ends of the curve (prev or next is None) the neighbouring point is mirrored.
+# Returns the left and right handles
+def mustardtools_ik_spline_auto_handle(prev, co, next):
+    
+    if prev is None:
+        prev = 2 * co - next
+    if next is None:
+        next = 2 * co - prev
+    
+    dvec_a = co - prev
+    dvec_b = next - co
+    len_a = float(np.linalg.norm(dvec_a)) or 1.
+    len_b = float(np.linalg.norm(dvec_b)) or 1.
+    tvec = dvec_b / len_b + dvec_a / len_a
+    length = float(np.linalg.norm(tvec)) * 2.5614
+    
+    if length == 0.:
+        return co, co
+    
+    return co - tvec * len_a / length, co + tvec * len_b / length
+
+# Handles of the segment between the controllers a and b of the curve that will be built, with prev and next the
+# neighbouring controllers (None at the ends of the curve). Without Fit Curve, the handles are the AUTO ones, except for
+# the last point, whose handles follow the end of the chain (see mustardtools_ik_spline_curve_points).
+# Returns the right handle of a and the left handle of b
+def mustardtools_ik_spline_segment_handles(points, prev, a, b, next, fit):
+    
+    if fit:
+        return mustardtools_ik_spline_fit_segment(points, a, b)
+    
+    handle_right = mustardtools_ik_spline_auto_handle(points[prev] if prev != None else None, points[a], points[b])[1]
+    if next != None:
+        handle_left = mustardtools_ik_spline_auto_handle(points[a], points[b], points[next])[0]
+    else:
+        handle_left = points[b] - (points[b] - points[b-1]) / 2
+    
+    return handle_right, handle_left
+
+# Bezier curve built without Fit Curve by mustardtools_ik_spline_curve_points, through the chain points at the controllers indices.
+# Returns the arrays of points, left handles and right handles
+def mustardtools_ik_spline_auto_handles(points, controllers):
+    
+    num = len(controllers)
+    co = points[controllers]
+    
+    handle_left = np.empty((num, 3))
+    handle_right = np.empty((num, 3))
+    
+    handle_left[0] = mustardtools_ik_spline_auto_handle(None, co[0], co[1])[0]
+    for i in range(0, num-1):
+        handle_right[i], handle_left[i+1] = mustardtools_ik_spline_segment_handles(points, controllers[i-1] if i > 0 else None,
+                                                                                controllers[i], controllers[i+1],
+                                                                                controllers[i+2] if i+2 < num else None, False)
+    
+    handle_right[num-1] = 2 * co[num-1] - handle_left[num-1]
+    
+    return co, handle_left, handle_right
+
+# Maximum distance of the chain points between the controllers a and b from the Bezier segment with handles p1 and p2,
+# and the index of the farthest chain point.
+# The segment is sampled, and the distance of the chain points is measured from the polyline of the samples
+def mustardtools_ik_spline_segment_error(points, a, b, p1, p2, samples=16):
+    
+    t = np.linspace(0., 1., samples)[:, None]
+    curve = (1-t)**3 * points[a] + 3 * (1-t)**2 * t * p1 + 3 * (1-t) * t**2 * p2 + t**3 * points[b]
+    
+    data = points[a:b+1][:, None, :]
+    start = curve[:-1][None, :, :]
+    direction = (curve[1:] - curve[:-1])[None, :, :]
+    u = np.clip(np.sum((data - start) * direction, axis=2) / np.maximum(np.sum(direction * direction, axis=2), 1e-16), 0., 1.)
+    distances = np.linalg.norm(data - (start + u[:, :, None] * direction), axis=2).min(axis=1)
+    farthest = int(np.argmax(distances))
+    
+    return float(distances[farthest]), a + farthest
+
+# Error of the segment i of the curve built with the controllers (see mustardtools_ik_spline_segment_error)
+def mustardtools_ik_spline_segment_fit_error(points, controllers, i, fit, samples=16):
+    
+    num = len(controllers)
+    handle_right, handle_left = mustardtools_ik_spline_segment_handles(points, controllers[i-1] if i > 0 else None,
+                                                                    controllers[i], controllers[i+1],
+                                                                    controllers[i+2] if i+2 < num else None, fit)
+    
+    return mustardtools_ik_spline_segment_error(points, controllers[i], controllers[i+1], handle_right, handle_left, samples)
+
+# Maximum distance of the chain points from the curve built with the controllers, used to compare controllers placements.
+# The curve is the one fitted with mustardtools_ik_spline_fit if fit is enabled, else the one with AUTO handles
+def mustardtools_ik_spline_fit_error(points, controllers, fit=True, samples=16):
+    
+    return max(mustardtools_ik_spline_segment_fit_error(points, controllers, i, fit, samples)[0] for i in range(0, len(controllers)-1))
+
+# Indices of the chain bones where the controllers are placed, depending on the chain geometry.
+# points are the heads of the chain bones followed by the tail of the last bone.
+# Starting from a single segment on the whole chain, the segment with the largest error is split at its farthest chain point
+# until all the controllers are placed, so that bent parts get more of them. The errors of the segments are kept in a heap,
+# and only the segments changed by a split are scored again: the two new ones, and without Fit Curve also their neighbours,
+# whose AUTO handles depend on the split point.
+# The placement with the lowest error between this and the even one is then refined, moving one controller by one bone
+# at a time while the error decreases, again scoring only the segments changed by the move. Each pass costs O(chain length).
+# The error is measured on the curve that will be built (see fit in mustardtools_ik_spline_fit_error), so the result
+# is never worse than the even placement
+def mustardtools_ik_spline_controllers_adaptive(points, num, fit=True, iterations=16):
+    
+    chain_length = len(points) - 1
+    controllers = [0, chain_length-1]
+    
+    # Segments changed when the controller i is added or moved: the adjacent ones, and without Fit Curve also their neighbours
+    def changed_segments(i, controllers_num):
+        return range(max(i - (1 if fit else 2), 0), min(i + (0 if fit else 1), controllers_num - 2) + 1)
+    
+    # Current segments, keyed by their first controller: (last controller, error, farthest chain point).
+    # Heap entries not matching the current segments are outdated, and skipped
+    segments = {}
+    heap = []
+    
+    def score(i):
+        a = controllers[i]
+        b = controllers[i+1]
+        error, farthest = mustardtools_ik_spline_segment_fit_error(points, controllers, i, fit)
+        segments[a] = (b, error, farthest)
+        # Larger errors first, then longer segments
+        heapq.heappush(heap, (-error, a-b, a, b, farthest))
+    
+    score(0)
+    
+    while len(controllers) < num and len(heap) > 0:
+        
+        neg_error, neg_length, a, b, farthest = heapq.heappop(heap)
+        if segments.get(a) != (b, -neg_error, farthest) or b - a < 2:
+            continue
+        
+        # Split at the farthest chain point, or in the middle if the segment already follows the chain
+        split = farthest if -neg_error > 0. and a < farthest < b else (a + b) // 2
+        i = bisect.bisect(controllers, a)
+        controllers.insert(i, split)
+        
+        for j in changed_segments(i, len(controllers)):
+            score(j)
+    
+    # The even placement is preferred when the errors are the same
+    candidates = [mustardtools_ik_spline_controllers(chain_length, num), controllers]
+    candidates_errors = [[mustardtools_ik_spline_segment_fit_error(points, candidate, i, fit)[0] for i in range(0, num-1)]
+                            for candidate in candidates]
+    errors_max = [max(errors) for errors in candidates_errors]
+    best = errors_max.index(min(errors_max))
+    controllers = candidates[best]
+    errors = candidates_errors[best]
+    error = errors_max[best]
+    
+    for iteration in range(0, iterations):
+        improved = False
+        for i in range(1, num-1):
+            for step in (-1, 1):
+                index = controllers[i] + step
+                if index <= controllers[i-1] or index >= controllers[i+1]:
+                    continue
+                candidate = controllers[:i] + [index] + controllers[i+1:]
+                candidate_errors = list(errors)
+                for j in changed_segments(i, num):
+                    candidate_errors[j] = mustardtools_ik_spline_segment_fit_error(points, candidate, j, fit)[0]
+                candidate_error = max(candidate_errors)
+                if candidate_error < error:
+                    controllers, errors, error, improved = candidate, candidate_errors, candidate_error, True
+        if not improved:
+            break
+    
+    return controllers
+
+# Lowest resolution of a Bezier spline that keeps the fitting error under the tolerance.
+# The error is the maximum distance between the curve and the polyline evaluated with that resolution,
+# that is the one followed by the Spline IK constraint
+def mustardtools_ik_spline_resolution(spline, tolerance, max_resolution=64):
+    
+    points_num = len(spline.bezier_points)
+    
+    co = np.empty(3 * points_num)
+    handle_left = np.empty(3 * points_num)
+    handle_right = np.empty(3 * points_num)
+    spline.bezier_points.foreach_get("co", co)
+    spline.bezier_points.foreach_get("handle_left", handle_left)
+    spline.bezier_points.foreach_get("handle_right", handle_right)
+    co = co.reshape((-1, 3))
+    handle_left = handle_left.reshape((-1, 3))
+    handle_right = handle_right.reshape((-1, 3))
+    
+    # Control points of each segment, with shape (segments, 1, 1, 3) for broadcasting
+    p0 = co[:-1, None, None, :]
+    p1 = handle_right[:-1, None, None, :]
+    p2 = handle_left[1:, None, None, :]
+    p3 = co[1:, None, None, :]
+    
+    def bezier(t):
+        t = t[None, :, :, None]
+        return (1-t)**3 * p0 + 3 * (1-t)**2 * t * p1 + 3 * (1-t) * t**2 * p2 + t**3 * p3
+    
+    # Samples inside every subdivision
+    samples = np.linspace(0., 1., 9)
+    
+    for resolution in range(1, max_resolution + 1):
+        start = np.arange(resolution)[:, None] / resolution
+        t = start + samples[None, :] / resolution
+        
+        curve = bezier(t)
+        polyline = bezier(start) + (bezier(start + 1. / resolution) - bezier(start)) * samples[None, None, :, None]
+        
+        if np.linalg.norm(curve - polyline, axis=3).max() <= tolerance:
+            return resolution
+    
+    return max_resolution
+
+# Assign the Bezier points (with their handles) to the hook modifiers of a curve.
+# assignments is a list of (hook modifier, point index, hook target world matrix).
+# Bezier points are stored as three vertices (left handle, control point, right handle), which can be set directly
+# (without mode switches) only from Blender 2.90. On Blender 2.83 the points are assigned with the hook operators,
+# in a single Edit mode pass on the curve for all the hooks.
+# The inverse matrix is the one computed by Reset Hook, with the hook target in its current position
+def mustardtools_ik_spline_hooks_assign(context, curve_obj, assignments):
+    
+    if len(assignments) == 0:
+        return
+    
+    if bpy.app.version >= (2, 90, 0):
+        for hook, point_index, target_matrix_world in assignments:
+            hook.vertex_indices_set([3*point_index, 3*point_index+1, 3*point_index+2])
+    else:
+        active = context.view_layer.objects.active
+        mode = active.mode if active != None else 'OBJECT'
+        if mode != 'OBJECT':
+            mustardtools_mode_set('OBJECT')
+        context.view_layer.objects.active = curve_obj
+        mustardtools_mode_set('EDIT')
+        
+        for hook, point_index, target_matrix_world in assignments:
+            for j, point in enumerate(curve_obj.data.splines[0].bezier_points):
+                point.select_left_handle = j == point_index
+                point.select_right_handle = j == point_index
+                point.select_control_point = j == point_index
+            bpy.ops.object.hook_assign(modifier=hook.name)
+        
+        mustardtools_mode_set('OBJECT')
+        context.view_layer.objects.active = active
+        if mode != 'OBJECT':
+            mustardtools_mode_set(mode)
+    
+    points = curve_obj.data.splines[0].bezier_points
+    for hook, point_index, target_matrix_world in assignments:
+        hook.center = points[point_index].co
+        hook.matrix_inverse = target_matrix_world.inverted() @ curve_obj.matrix_world
+
+# Set the points of a Bezier spline on the chain points at the controllers indices.
+# chain_points are the heads of the chain bones followed by the tail of the last bone
+def mustardtools_ik_spline_curve_points(polyline, chain_points, controllers, fit):
+    
+    num = len(controllers)
+    chain_length = len(chain_points) - 1
+    
+    if fit:
+        
+        # Handles computed with a least-squares fit on the whole chain
+        co, handle_left, handle_right = mustardtools_ik_spline_fit(chain_points, controllers)
+        
+        # Use FREE while setting the handles, so that they are not recomputed
+        for i, point in enumerate(polyline.bezier_points):
+            point.handle_right_type = 'FREE'
+            point.handle_left_type = 'FREE'
+            point.co = co[i]
+            point.handle_left = handle_left[i]
+            point.handle_right = handle_right[i]
+    
+    else:
+        
+        for i in range(0,num-1):
+            polyline.bezier_points[i].co = chain_points[controllers[i]]
+            # Use AUTO to generate handles (changed later to ALIGNED to enable rotations)
+            polyline.bezier_points[i].handle_right_type = 'AUTO'
+            polyline.bezier_points[i].handle_left_type = 'AUTO'
+        
+        # The last point handles follow the direction of the last bone
+        last = Vector(chain_points[chain_length-1])
+        last_direction = Vector(chain_points[chain_length-1] - chain_points[chain_length-2]) / 2
+        polyline.bezier_points[num-1].co = last
+        polyline.bezier_points[num-1].handle_right = last + last_direction
+        polyline.bezier_points[num-1].handle_left = last - last_direction
+        polyline.bezier_points[num-1].handle_right_type = 'ALIGNED'
+        polyline.bezier_points[num-1].handle_left_type = 'ALIGNED'
+    
+    # Change the handle type to ALIGNED to enable rotations
+    for point in polyline.bezier_points:
+        point.handle_right_type = 'ALIGNED'
+        point.handle_left_type = 'ALIGNED'
+
+# Create an empty copying the transforms of a controller bone, used as hook target
+def mustardtools_ik_spline_empty(name, location, arm, bone_name, first, collection):
+    
+    empty = bpy.data.objects.new(name, None)
+    empty.location = location
+    constraint = empty.constraints.new('COPY_TRANSFORMS')
+    constraint.target = arm
+    constraint.subtarget = bone_name
+    if first:
+        empty.empty_display_type = "SPHERE"
+    else:
+        empty.empty_display_type = "CIRCLE"
+    collection.objects.link(empty)
+    empty.hide_render = True
+    empty.hide_viewport = True
+    
+    return empty
+
+# Set the custom shapes of the controller bones: the ones selected in the options, else the empties shapes (if available).
+# Only the bones with a different shape are updated. Returns the number of updated bones
+def mustardtools_ik_spline_shapes(arm, settings, controllers_names, empties):
+    
+    updated = 0
+    
+    for i, bone_name in enumerate(controllers_names):
+        shape = settings.ik_spline_first_bone_custom_shape if i == 0 else settings.ik_spline_bone_custom_shape
+        if shape == None and len(empties) > 0:
+            shape = empties[i]
+        if shape == None:
+            continue
+        bone = arm.pose.bones[bone_name]
+        if bone.custom_shape != shape:
+            bone.custom_shape = shape
+            bone.use_custom_shape_bone_size = True
+            updated = updated + 1
+    
+    return updated
+
 class MUSTARDTOOLS_OT_IKSpline(bpy.types.Operator):
-    """This tool will create an IK spline on the selected chain.\nSelect the bones, the last one being the tip of the chain.\n\nConditions:\n    - select at least 4 bones\n    - the number of controllers should be lower than the number of bones - 1"""
+    """This tool will create an IK spline on the selected chain.\nSelect the bones of the chain in any order: they are ordered from the root to the tip of the chain.\n\nConditions:\n    - select at least 4 bones\n    - the selected bones should be a single connected chain\n    - the number of controllers should be lower than the number of bones - 1"""
     bl_idname = "mustardui.ik_spline"
     bl_label = "Create"
     bl_options = {'REGISTER','UNDO'}
@@ -503,29 +1940,14 @@ class MUSTARDTOOLS_OT_IKSpline(bpy.types.Operator):
         
         settings = bpy.context.scene.mustardtools_settings
         
-        if context.mode != "POSE" or bpy.context.selected_pose_bones == None:
+        selection = mustardtools_constraint_index_selection(context)
+        
+        if selection == None or settings.ik_spline_number > selection["selected_num"]-1 or selection["selected_num"] < 3:
             return False
-        else:
-            
-            chain_bones = bpy.context.selected_pose_bones
-            
-            if settings.ik_spline_number > len(chain_bones)-1:
-                return False
-            if len(chain_bones) < 3:
-                return False
-            else:
-                abort_aa = False
-                for bone in chain_bones:
-                    for constraint in bone.constraints:
-                        if constraint.type == 'SPLINE_IK':
-                            abort_aa = True
-                            break
-                
-                if abort_aa:
-                    return False
-                else:
-                    return True
+        
+        return not selection["selected_spline_ik"]
 
+    @mustardtools_profile
     def execute(self, context):
         
         # Import settings
@@ -542,184 +1964,169 @@ class MUSTARDTOOLS_OT_IKSpline(bpy.types.Operator):
     
         # Definitions
         arm = bpy.context.object
-        chain_bones = bpy.context.selected_pose_bones
+        chain_bones = mustardtools_chain_resolve(arm, mustardtools_selected_pose_bones(arm))
+        if chain_bones == None:
+            self.report({'ERROR'}, 'MustardTools - The selected bones are not a single chain.')
+            return {'CANCELLED'}
         chain_length = len(chain_bones)
-        chain_last_bone = chain_bones[chain_length-1]
         
-        # Output a warning if the location has not been applied to the armature
-        warning = 0
-        if arm.location.x != 0. or arm.location.y != 0. or arm.location.z != 0.:
-            self.report({'WARNING'}, 'MustardTools - The Armature selected seems not to have location applied. This might generate odd results!')
-            print("MustardTools IK Spline - Apply the location on the armature with Ctrl+A in Object mode!")
-            warning += 1
+        mustardtools_log_ik_spline.debug("Armature selected: %s", arm.name)
+        mustardtools_log_ik_spline.debug("Chain length: %d", chain_length)
         
-        if settings.ms_debug:
-            print("MustardTools IK Spline - Armature selected: " + bpy.context.object.name)
-            print("MustardTools IK Spline - Chain length: " + str(chain_length))
-        
-        # Create the curve in Object mode
-        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-        
-        curveData = bpy.data.curves.new(IKSpline_Curve_Name, type='CURVE')
-        curveData.dimensions = '3D'
-        curveData.use_path = True
-        
-        # Create the path for the curve in Edit mode
-        bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+        # Save the names, as changing mode will erase the bone data
+        chains = [[bone.name for bone in chain_bones]]
         
-        polyline = curveData.splines.new('BEZIER')
-        polyline.bezier_points.add(num-1)
+        # The counterpart chain is rigged in the same passes
+        if settings.ik_spline_symmetry:
+            mustardtools_chains_mirror(arm, chains, 2)
         
-        # Fill the curve with the points, and also create controller bones
-        b = []
-        b_name = []
-        
-        for i in range(0,num-1):
-            # Create the point to insert in the curve, at the head of the bone
-            (x,y,z) = (chain_bones[int(chain_length/(num-1)*i)].head.x,
-                        chain_bones[int(chain_length/(num-1)*i)].head.y,
-                        chain_bones[int(chain_length/(num-1)*i)].head.z)
-            polyline.bezier_points[i].co = (x, y, z)
-            # Use AUTO to generate handles (should be changed later to ALIGNED to enable rotations)
-            polyline.bezier_points[i].handle_right_type = 'AUTO'
-            polyline.bezier_points[i].handle_left_type = 'AUTO'
+        # Save the positions of the chains
+        IK_rigs = []
+        for chain_names in chains:
+            # Chain points in world space, as the curve is created in world space.
+            # This supports armatures with any transform, without applying it
+            chain_heads, chain_tails, chain_points = mustardtools_ik_spline_chain(arm, chain_names, arm.matrix_world)
             
-            # Create the controller bone
-            b = arm.data.edit_bones.new(IKSpline_Bone_Name)
-            b.use_deform = False
-            b.head = chain_bones[int(chain_length/(num-1)*i)].head
-            b.tail = chain_bones[int(chain_length/(num-1)*i)].tail
+            IK_rigs.append({"chain_names": chain_names, "chain_heads": chain_heads, "chain_tails": chain_tails, "chain_points": chain_points})
+        
+        with mustardtools_profile_phase("Controllers placement"):
+            # Indices of the chain bones where the controllers are placed.
+            # The counterpart chain uses the same indices, so that the rigs are symmetric
+            if settings.ik_spline_adaptive:
+                controllers = mustardtools_ik_spline_controllers_adaptive(IK_rigs[0]["chain_points"], num, settings.ik_spline_fit)
+            else:
+                controllers = mustardtools_ik_spline_controllers(chain_length, num)
             
-            # Save the name, as changing context will erase the bone data
-            b_name.append(b.name)
+            mustardtools_log_ik_spline.debug("Controllers placed on bones: %s", controllers)
             
-            if settings.ms_debug:
-                print("MustardTools IK Spline - Bone created with head: " + str(b[i].head.x) + " , " + str(b[i].head.y) + " , " + str(b[i].head.z))
-                print("                                       and tail: " + str(b[i].tail.x) + " , " + str(b[i].tail.y) + " , " + str(b[i].tail.z))
-        
-        # The same as above, but for the last bone
-        i += 1
-        (x,y,z) = (chain_bones[chain_length-1].head.x,chain_bones[chain_length-1].head.y,chain_bones[chain_length-1].head.z)
-        (x2,y2,z2) = (chain_bones[chain_length-2].head.x,chain_bones[chain_length-2].head.y,chain_bones[chain_length-2].head.z)
-        polyline.bezier_points[i].co = (x, y, z)
-        polyline.bezier_points[i].handle_right = ( x+(x-x2)/2 , y+(y-y2)/2, z+(z-z2)/2)
-        polyline.bezier_points[i].handle_left = (x2+(x-x2)/2, y2+(y-y2)/2, z2+(z-z2)/2)
-        polyline.bezier_points[i].handle_right_type = 'ALIGNED'
-        polyline.bezier_points[i].handle_left_type = 'ALIGNED'
-        
-        b = arm.data.edit_bones.new(IKSpline_Bone_Name)
-        b.use_deform = False
-        b.head = chain_bones[chain_length-1].head
-        b.tail = chain_bones[chain_length-1].tail
-        b_name.append(b.name)
-        
-        if settings.ms_debug:
-            print("MustardTools IK Spline - Bone created with head: " + str(b[i].head.x) + " , " + str(b[i].head.y) + " , " + str(b[i].head.z))
-            print("                                       and tail: " + str(b[i].tail.x) + " , " + str(b[i].tail.y) + " , " + str(b[i].tail.z))
+        # Create the controller bones of all the rigs in Edit mode. This is the only mode switch needed
+        mustardtools_mode_set('EDIT')
         
-        # Enable bendy bones if the option has been selected
-        if settings.ik_spline_bendy:
-            for bone in chain_bones:
-                arm.data.edit_bones[bone.name].bbone_segments = settings.ik_spline_bendy_segments
+        with mustardtools_profile_phase("Bone creation"):
+            for IK_rig in IK_rigs:
+                
+                chain_names = IK_rig["chain_names"]
+                if settings.ik_spline_symmetry:
+                    bone_name = mustardtools_mirror_side_name(IKSpline_Bone_Name, chain_names[chain_length-1])
+                else:
+                    bone_name = IKSpline_Bone_Name
+                
+                b_name = []
+                
+                for i in range(0,num):
+                    
+                    b = arm.data.edit_bones.new(bone_name)
+                    b.use_deform = False
+                    b.head = IK_rig["chain_heads"][controllers[i]]
+                    b.tail = IK_rig["chain_tails"][controllers[i]]
+                    
+                    # Save the name, as changing context will erase the bone data
+                    b_name.append(b.name)
+                    
+                    mustardtools_log_ik_spline.debug("Bone %s created with head: %.4f, %.4f, %.4f and tail: %.4f, %.4f, %.4f", b.name, *b.head, *b.tail)
+                
+                IK_rig["b_name"] = b_name
+                
+                # Enable bendy bones if the option has been selected
+                if settings.ik_spline_bendy:
+                    for bone_name in chain_names:
+                        arm.data.edit_bones[bone_name].bbone_segments = settings.ik_spline_bendy_segments
             
-            # Switch to B-Bone view for the Armature bones
+        # Switch to B-Bone view for the Armature bones
+        if settings.ik_spline_bendy:
             arm.data.display_type = "BBONE"
         
-        # GO back to Object mode
-        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-        
-        # Create empties
-        e = []
-        for i in range(0,num):
-            e.append( bpy.data.objects.new(IKSpline_Empty_Name, None) )
-            e[i].location=curveData.splines[0].bezier_points[i].co
-            constraint=e[i].constraints.new('COPY_TRANSFORMS')
-            constraint.target = arm
-            constraint.subtarget = b_name[i]
-            if i == 0:
-                e[i].empty_display_type="SPHERE"
-            else:
-                e[i].empty_display_type="CIRCLE"
-            bpy.context.collection.objects.link(e[i])
-            e[i].hide_render = True
-            e[i].hide_viewport = True
-            if settings.ms_debug:
-                print("MustardTools IK Spline - Empty created at: " + str(e[i].location.x) + " , " + str(e[i].location.y) + " , " + str(e[i].location.z))
-            
-        # Set bones custom shape if selected in the options, else use the Empty default shapes
-        if settings.ik_spline_first_bone_custom_shape != None:
-            bone = arm.pose.bones[b_name[0]]
-            bone.custom_shape = settings.ik_spline_first_bone_custom_shape
-            bone.use_custom_shape_bone_size = True
-        else:
-            bone = arm.pose.bones[b_name[0]]
-            bone.custom_shape = e[0]
-            bone.use_custom_shape_bone_size = True
-        
-        if settings.ik_spline_bone_custom_shape != None:
-            for i in range(1,num):
-                bone = arm.pose.bones[b_name[i]]
-                bone.custom_shape = settings.ik_spline_bone_custom_shape
-                bone.use_custom_shape_bone_size = True
-        else:
-            for i in range(1,num):
-                bone = arm.pose.bones[b_name[i]]
-                bone.custom_shape = e[i]
-                bone.use_custom_shape_bone_size = True
-        
-        # Create curve object
-        curveOB = bpy.data.objects.new(IKSpline_Curve_Name, curveData)
+        mustardtools_mode_set('POSE')
+        mustardtools_chain_index_invalidate(arm)
         
-        # Create hook modifiers
-        m = []
-        for i in range(0,num):
-            m.append( curveOB.modifiers.new(IKSpline_Hook_Modifier_Name, 'HOOK') )
-            m[i].object = e[i]
-        
-        # Link the curve in the scene and use as active object
-        bpy.context.collection.objects.link(curveOB)
-        context.view_layer.objects.active = curveOB
-        
-        # Go in Edit mode
-        bpy.ops.object.editmode_toggle()
-        
-        # Hook the curve points to the empties
-        for i in range(0,num):
+        for IK_rig in IK_rigs:
             
-            select_index = i
-            for j, point in enumerate(curveData.splines[0].bezier_points) :
-                point.select_left_handle = j == select_index
-                point.select_right_handle = j == select_index
-                point.select_control_point = j == select_index
+            chain_names = IK_rig["chain_names"]
+            chain_points = IK_rig["chain_points"]
+            b_name = IK_rig["b_name"]
             
-            bpy.ops.object.hook_assign(modifier=m[i].name)
-            bpy.ops.object.hook_reset(modifier=m[i].name)
+            with mustardtools_profile_phase("Curve"):
+                # Create the curve, with a point at the head of each controller bone
+                curveData = bpy.data.curves.new(IKSpline_Curve_Name, type='CURVE')
+                curveData.dimensions = '3D'
+                curveData.use_path = True
+                
+                polyline = curveData.splines.new('BEZIER')
+                polyline.bezier_points.add(num-1)
+                
+                mustardtools_ik_spline_curve_points(polyline, chain_points, controllers, settings.ik_spline_fit)
+                
+            with mustardtools_profile_phase("Empties"):
+                # Create empties, unless the curve is hooked directly to the controller bones
+                e = []
+                for i in range(0,num if not settings.ik_spline_bone_hooks else 0):
+                    e.append( mustardtools_ik_spline_empty(IKSpline_Empty_Name, polyline.bezier_points[i].co, arm, b_name[i], i == 0, bpy.context.collection) )
+                    mustardtools_log_ik_spline.debug("Empty %s created at: %.4f, %.4f, %.4f", e[i].name, *e[i].location)
+                    
+                # Set bones custom shape if selected in the options, else use the Empty default shapes (if available)
+                mustardtools_ik_spline_shapes(arm, settings, b_name, e)
+                
+            # Create curve object and link it in the scene.
+            # The curve is parented to the armature, keeping its world space position
+            curveOB = bpy.data.objects.new(IKSpline_Curve_Name, curveData)
+            curveOB.parent = arm
+            curveOB.matrix_parent_inverse = arm.matrix_world.inverted()
+            bpy.context.collection.objects.link(curveOB)
             
-            # Change the handle type to ALIGNED to enable rotations
-            curveData.splines[0].bezier_points[i].handle_right_type = 'ALIGNED'
-            curveData.splines[0].bezier_points[i].handle_left_type = 'ALIGNED'
-        
-        bpy.ops.object.mode_set(mode='OBJECT', toggle=False)
-        
-        # Create Spline IK modifier
-        IKSplineConstr = chain_last_bone.constraints.new('SPLINE_IK')
-        IKSplineConstr.name = IKSpline_Constraint_Name
-        IKSplineConstr.target = curveOB
-        IKSplineConstr.chain_count = chain_length
-        IKSplineConstr.y_scale_mode = "BONE_ORIGINAL"
-        IKSplineConstr.xz_scale_mode = "BONE_ORIGINAL"
-        
-        # Final settings cleanup
-        curveData.resolution_u = settings.ik_spline_resolution
-        
-        # Go back to pose mode
-        context.view_layer.objects.active = arm
-        bpy.ops.object.mode_set(mode='POSE')
+            with mustardtools_profile_phase("Hooks"):
+                # Create hook modifiers, assigning the point (and its handles) directly.
+                # The hook targets (controller bones, or empties copying their transforms) are in rest pose,
+                # so the inverse matrix is computed from the bone rest matrix (as done by Reset Hook)
+                assignments = []
+                for i in range(0,num):
+                    hook = curveOB.modifiers.new(IKSpline_Hook_Modifier_Name, 'HOOK')
+                    if settings.ik_spline_bone_hooks:
+                        hook.object = arm
+                        hook.subtarget = b_name[i]
+                    else:
+                        hook.object = e[i]
+                    assignments.append((hook, i, arm.matrix_world @ arm.data.bones[b_name[i]].matrix_local))
+                mustardtools_ik_spline_hooks_assign(context, curveOB, assignments)
+                polyline = curveOB.data.splines[0]
+                
+            with mustardtools_profile_phase("Constraints"):
+                # Create Spline IK modifier
+                IKSplineConstr = arm.pose.bones[chain_names[chain_length-1]].constraints.new('SPLINE_IK')
+                IKSplineConstr.name = IKSpline_Constraint_Name
+                IKSplineConstr.target = curveOB
+                IKSplineConstr.chain_count = chain_length
+                IKSplineConstr.y_scale_mode = "BONE_ORIGINAL"
+                IKSplineConstr.xz_scale_mode = "BONE_ORIGINAL"
+                
+                # Record the rig in the registry
+                rig = mustardtools_rig_new(arm, 'IK_SPLINE')
+                for bone_name in chain_names[:chain_length-1]:
+                    mustardtools_rig_add_bone(arm, rig, bone_name, 'CHAIN')
+                mustardtools_rig_add_bone(arm, rig, chain_names[chain_length-1], 'CONSTRAINT')
+                for bone_name in b_name:
+                    mustardtools_rig_add_bone(arm, rig, bone_name, 'CONTROLLER')
+                rig.curve = curveOB
+                rig.fit = settings.ik_spline_fit
+                for empty in e:
+                    mustardtools_rig_add_object(rig, empty)
+                
+            with mustardtools_profile_phase("Curve"):
+                # Final settings cleanup
+                if settings.ik_spline_adaptive:
+                    chain_size = float(np.linalg.norm(np.diff(chain_points, axis=0), axis=1).sum())
+                    curveData.resolution_u = mustardtools_ik_spline_resolution(polyline, chain_size * settings.ik_spline_tolerance / 100.)
+                    mustardtools_log_ik_spline.debug("Curve resolution: %d", curveData.resolution_u)
+                else:
+                    curveData.resolution_u = settings.ik_spline_resolution
         
-        # Final messag, if no warning were raised during the execution
-        if warning == 0:
+        # Final message
+        if len(IK_rigs) > 1:
+            self.report({'INFO'}, 'MustardTools - ' + str(len(IK_rigs)) + ' IK spline rigs successfully created.')
+        else:
             self.report({'INFO'}, 'MustardTools - IK spline rig successfully created.')
         
+        mustardtools_constraint_index_invalidate(arm)
+        
         return {'FINISHED'}
     
 class MUSTARDTOOLS_OT_IKSpline_Clean(bpy.types.Operator):
@@ -739,132 +2146,392 @@ class MUSTARDTOOLS_OT_IKSpline_Clean(bpy.types.Operator):
     
     @classmethod
     def poll(cls, context):
-        if context.mode != "POSE" or bpy.context.selected_pose_bones == None:
-            return False
-        else:
-            
-            chain_bones = bpy.context.selected_pose_bones
-            
-            if len(chain_bones) < 1:
-                return False
-            else:
-                abort_aa = True
-                for bone in chain_bones:
-                    for constraint in bone.constraints:
-                        if constraint.type == 'SPLINE_IK':
-                            abort_aa = False
-                            break
-                
-                if abort_aa:
-                    return False
-                else:
-                    return True
+        
+        selection = mustardtools_constraint_index_selection(context)
+        
+        return selection != None and selection["selected_spline_ik"]
 
+    @mustardtools_profile
     def execute(self, context):
         
-        settings = bpy.context.scene.mustardtools_settings
-        
         arm = bpy.context.object
-        chain_bones = bpy.context.selected_pose_bones
-        
-        e = []
-        
-        removed_constr = 0
-        removed_bones = 0
-        
-        bpy.ops.object.mode_set(mode='EDIT', toggle=False)
-        
-        if self.reset_bendy:
+        chain_bones = mustardtools_selected_pose_bones(arm)
+        
+        # Bendy bones are reset on all the bones of the chains controlled by the constraints
+        reset_bones = mustardtools_chain_clean_bones(arm, chain_bones, 'SPLINE_IK')
+        
+        with mustardtools_profile_phase("Constraints"):
+            # Collect everything that should be removed in a single Pose mode scan
+            # The curves, empties and bones of the rigs generated by the tools are found in the registry,
+            # the other ones walking the hook modifiers of the constraint target
+            constraints = []
+            curves = {}
+            empties = {}
+            bones = set()
+            rigs = []
+            
             for bone in chain_bones:
-                arm.data.edit_bones[bone.name].bbone_segments = 1
-            arm.data.display_type = "OCTAHEDRAL"
-            if settings.ms_debug:
-                print("MustardTools IK Spline - Bendy bones resetted")
-        
-        bpy.ops.object.mode_set(mode='POSE', toggle=False)
-
-        for bone in chain_bones:
-            for constraint in bone.constraints:
-                if constraint.type == 'SPLINE_IK':
-                    
-                        bpy.ops.object.mode_set(mode='EDIT', toggle=False)
+                for constraint in bone.constraints:
+                    if constraint.type == 'SPLINE_IK':
+                        
+                        constraints.append((bone.name, constraint.name))
+                        
+                        rig = mustardtools_rig_find(arm, bone.name, constraint)
+                        if rig != None:
+                            rigs.append(rig.rig_id)
+                            curves[rig.curve.name] = rig.curve
+                            for item in rig.empties:
+                                if item.object != None:
+                                    empties[item.object.name] = item.object
+                            bones.update((arm.name, bone_name) for bone_name in mustardtools_rig_bones(rig, ('CONTROLLER',)))
+                            continue
+                        
+                        if constraint.target == None:
+                            continue
                         
-                        if constraint.target != None:
-                            IKCurve = constraint.target
-                            for hook_mod in IKCurve.modifiers:
-                                if hook_mod.object != None:
-                                    
-                                    IKEmpty = hook_mod.object
-                                    e.append(IKEmpty.name)
-                                    
-                                    if self.delete_bones:
-                                        for e_constraint in IKEmpty.constraints:
-                                            if e_constraint.type=="COPY_TRANSFORMS":
-                                                if e_constraint.target != None and e_constraint.subtarget != None and e_constraint.subtarget != "":
-                                                    IKArm = e_constraint.target
-                                                    IKBone = IKArm.data.edit_bones[e_constraint.subtarget]
-                                                    IKBone_name = IKBone.name
-                                                    IKArm.data.edit_bones.remove(IKBone)
-                                                    if settings.ms_debug:
-                                                        print("MustardTools IK Spline - Bone " + IKBone_name + " removed from Armature " + IKArm.name)
-                                                    removed_bones = removed_bones + 1
-                                    
-                        bpy.ops.object.mode_set(mode='OBJECT')
-                        bpy.ops.object.select_all(action='DESELECT')
-                        for empty_name in e:
-                            empty = bpy.data.objects[empty_name]
-                            bpy.context.collection.objects.unlink(empty)
-                            bpy.data.objects.remove(empty)
-                    
-                        bpy.ops.object.select_all(action='DESELECT')
                         IKCurve = constraint.target
-                        IKCurve_name = IKCurve.name
-                        bpy.context.collection.objects.unlink(IKCurve)
-                        bpy.data.objects.remove(IKCurve)
-                        if settings.ms_debug:
-                            print("MustardTools IK Spline - Curve " + IKCurve_name + " removed.")
+                        curves[IKCurve.name] = IKCurve
                         
-                        bpy.ops.object.mode_set(mode='POSE')
-                    
-                        IKConstr_name = constraint.name
-                        bone.constraints.remove(constraint)
-                        removed_constr = removed_constr + 1
-                        if settings.ms_debug:
-                            print("MustardTools IK Spline - Constraint " + IKConstr_name + " removed from " + bone.name + ".")
+                        for hook_mod in IKCurve.modifiers:
+                            if hook_mod.type != 'HOOK' or hook_mod.object == None:
+                                continue
+                            
+                            # Curve points hooked directly to the controller bones
+                            if hook_mod.object.type == 'ARMATURE':
+                                if hook_mod.subtarget != "":
+                                    bones.add((hook_mod.object.name, hook_mod.subtarget))
+                            
+                            # Curve points hooked to empties copying the controller bones transforms
+                            else:
+                                IKEmpty = hook_mod.object
+                                empties[IKEmpty.name] = IKEmpty
+                                for e_constraint in IKEmpty.constraints:
+                                    if e_constraint.type=="COPY_TRANSFORMS" and e_constraint.target != None and e_constraint.subtarget != None and e_constraint.subtarget != "":
+                                        bones.add((e_constraint.target.name, e_constraint.subtarget))
+            
+            # Remove the constraints
+            for bone_name, constraint_name in constraints:
+                bone = arm.pose.bones[bone_name]
+                bone.constraints.remove(bone.constraints[constraint_name])
+                mustardtools_log_ik_spline.debug("Constraint %s removed from %s", constraint_name, bone_name)
+            
+        removed_constr = len(constraints)
+        removed_bones = 0
+        
+        # Reset bendy bones and remove the controller bones in a single Edit mode pass
+        mustardtools_mode_set('EDIT')
+        
+        with mustardtools_profile_phase("Bone removal"):
+            if self.reset_bendy:
+                for bone_name in reset_bones:
+                    arm.data.edit_bones[bone_name].bbone_segments = 1
+                arm.data.display_type = "OCTAHEDRAL"
+                mustardtools_log_ik_spline.debug("Bendy bones reset on %d bones", len(reset_bones))
+            
+            if self.delete_bones:
+                for arm_name, bone_name in bones:
+                    # Only the bones of the armature in Edit mode can be removed
+                    if arm_name != arm.name or bone_name not in arm.data.edit_bones:
+                        continue
+                    arm.data.edit_bones.remove(arm.data.edit_bones[bone_name])
+                    removed_bones = removed_bones + 1
+                    mustardtools_log_ik_spline.debug("Bone %s removed from Armature %s", bone_name, arm.name)
+            
+        mustardtools_mode_set('POSE')
+        mustardtools_chain_index_invalidate(arm)
+        
+        for rig_id in rigs:
+            mustardtools_rig_remove(arm, rig_id)
+        
+        # Remove curves and empties at once, from any collection they are linked to.
+        # The curve data is removed too, if not used by other objects
+        with mustardtools_profile_phase("Objects removal"):
+            ids = list(curves.values()) + list(empties.values())
+            ids += [IKCurve.data for IKCurve in curves.values() if IKCurve.data != None and IKCurve.data.users == 1]
+            bpy.data.batch_remove(ids=ids)
+            
+        mustardtools_log_ik_spline.debug("%d curves and %d empties removed", len(curves), len(empties))
         
         if self.delete_bones:
             self.report({'INFO'}, 'MustardTools - '+ str(removed_constr) +' IK constraints and '+ str(removed_bones) +' Bones successfully removed.')
         else:
             self.report({'INFO'}, 'MustardTools - '+ str(removed_constr) +' IK constraints successfully removed.')
         
+        mustardtools_constraint_index_invalidate(arm)
+        
         return {'FINISHED'}
     
     def invoke(self, context, event):
         
         return context.window_manager.invoke_props_dialog(self)
             
-    def draw(self, context):
+    def draw(self, context):
+        
+        layout = self.layout
+        
+        arm = bpy.context.object
+        chain_bones = mustardtools_selected_pose_bones(arm)
+        
+        IK_num = 0
+        IK_num_nMUI = 0
+        for bone in chain_bones:
+            for constraint in bone.constraints:
+                if constraint.type == 'SPLINE_IK':
+                    IK_num = IK_num + 1
+                    if mustardtools_rig_find(arm, bone.name, constraint, refresh=False) == None:
+                        IK_num_nMUI = IK_num_nMUI + 1
+        
+        box = layout.box()
+        box.prop(self, "delete_bones")
+        box.prop(self, "reset_bendy")
+        box = layout.box()
+        box.label(text="Will be removed:", icon="ERROR")
+        box.label(text="        - " + str(IK_num) + " Spline IK constraints.")
+        box.label(text="        - " + str(IK_num_nMUI) + " of which are not Mustard Tools generated.")
+
+class MUSTARDTOOLS_OT_IKSpline_Rebuild(bpy.types.Operator):
+    """This tool will update the IK spline rigs of the selected bones to the current settings, without creating them again.\nOnly the controllers that changed are added or removed, so the animation of the other ones is preserved.\nSelect a bone with a Spline IK constraint generated by Mustard Tools to enable the tool"""
+    bl_idname = "mustardui.ik_splinerebuild"
+    bl_label = "Rebuild"
+    bl_options = {'REGISTER','UNDO'}
+    
+    @classmethod
+    def poll(cls, context):
+        
+        selection = mustardtools_constraint_index_selection(context)
+        
+        return selection != None and selection["selected_spline_ik"]
+
+    @mustardtools_profile
+    def execute(self, context):
+        
+        # Import settings
+        settings = bpy.context.scene.mustardtools_settings
+        name_prefix = settings.ms_naming_prefix
+        num = settings.ik_spline_number
+        
+        # Naming convention
+        IKSpline_Bone_Name = name_prefix + ".IKSpline.Bone"
+        IKSpline_Hook_Modifier_Name = name_prefix + ".IKSpline.Hook"
+        IKSpline_Empty_Name = name_prefix + ".IKSpline.Empty"
+        
+        arm = bpy.context.object
+        bbone_segments = settings.ik_spline_bendy_segments if settings.ik_spline_bendy else 1
+        
+        # Compare the rigs with the settings in a single Pose mode scan
+        with mustardtools_profile_phase("Comparison"):
+            plans = []
+            
+            # Rigs of the Spline IK constraints in the selected bones
+            rigs = []
+            for bone in mustardtools_selected_pose_bones(arm):
+                for constraint in bone.constraints:
+                    
+                    if constraint.type != 'SPLINE_IK':
+                        continue
+                    rig = mustardtools_rig_find(arm, bone.name, constraint)
+                    if rig == None or rig.curve == None:
+                        continue
+                    rigs.append((bone, constraint, rig))
+            
+            # The chains are read in the pose they have without the Spline IK constraints, as done by the rig creation.
+            # The constraints are muted together, so that the pose is evaluated only once
+            mute = [constraint.mute for bone, constraint, rig in rigs]
+            for bone, constraint, rig in rigs:
+                constraint.mute = True
+            context.view_layer.update()
+            
+            try:
+                for bone, constraint, rig in rigs:
+                    
+                    chain_names = mustardtools_chain_constraint_bones(arm, bone.name, constraint.chain_count)
+                    chain_length = len(chain_names)
+                    if num > chain_length - 1:
+                        self.report({'WARNING'}, 'MustardTools - The chain of ' + bone.name + ' is too short for ' + str(num) + ' controllers.')
+                        continue
+                    
+                    # Chain points in the curve space, which is the world space of the rig creation
+                    curveOB = rig.curve
+                    matrix = curveOB.matrix_world.inverted() @ arm.matrix_world
+                    chain_heads, chain_tails, chain_points = mustardtools_ik_spline_chain(arm, chain_names, matrix)
+                    
+                    if settings.ik_spline_adaptive:
+                        controllers = mustardtools_ik_spline_controllers_adaptive(chain_points, num, settings.ik_spline_fit)
+                    else:
+                        controllers = mustardtools_ik_spline_controllers(chain_length, num)
+                    
+                    # Chain bone of each existing controller, found from its rest position
+                    existing = {}
+                    controllers_old = mustardtools_rig_bones(rig, ('CONTROLLER',))
+                    if len(controllers_old) > 0:
+                        heads = mustardtools_ik_spline_world_points(matrix, [arm.data.bones[bone_name].head_local for bone_name in controllers_old])
+                        for bone_name, head in zip(controllers_old, heads):
+                            existing.setdefault(int(np.argmin(np.linalg.norm(chain_points[:chain_length] - head, axis=1))), bone_name)
+                    
+                    keep = {index: existing[index] for index in controllers if index in existing}
+                    
+                    # New controllers keep the side naming of rigs created with Symmetry
+                    if settings.ik_spline_symmetry or any(mustardtools_mirror_match(bone_name) != None for bone_name in controllers_old):
+                        bone_name_new = mustardtools_mirror_side_name(IKSpline_Bone_Name, chain_names[chain_length-1])
+                    else:
+                        bone_name_new = IKSpline_Bone_Name
+                    
+                    # Hook modifiers and empties of the existing controllers
+                    hooks = {}
+                    for hook in curveOB.modifiers:
+                        if hook.type != 'HOOK' or hook.object == None:
+                            continue
+                        if hook.object == arm:
+                            hooks[hook.subtarget] = (hook.name, None)
+                        else:
+                            for e_constraint in hook.object.constraints:
+                                if e_constraint.type == "COPY_TRANSFORMS" and e_constraint.target == arm:
+                                    hooks[e_constraint.subtarget] = (hook.name, hook.object)
+                    
+                    plans.append({"rig_id": rig.rig_id,
+                                "curve": curveOB,
+                                "chain_names": chain_names,
+                                "chain_heads": chain_heads,
+                                "chain_tails": chain_tails,
+                                "chain_points": chain_points,
+                                "controllers": controllers,
+                                "keep": keep,
+                                "bone_name": bone_name_new,
+                                "add": [index for index in controllers if index not in keep],
+                                "remove": [bone_name for bone_name in controllers_old if bone_name not in keep.values()],
+                                "hooks": hooks})
+            finally:
+                for (bone, constraint, rig), constraint_mute in zip(rigs, mute):
+                    constraint.mute = constraint_mute
+                context.view_layer.update()
+            
+        if len(plans) == 0:
+            self.report({'WARNING'}, 'MustardTools - No IK spline rig generated by Mustard Tools to rebuild in the selected bones.')
+            return {'CANCELLED'}
+        
+        # Add and remove the controller bones in a single Edit mode pass, only if needed
+        if any(len(plan["add"]) > 0 or len(plan["remove"]) > 0 for plan in plans):
+            
+            mustardtools_mode_set('EDIT')
+            
+            with mustardtools_profile_phase("Bone creation"):
+                for plan in plans:
+                    for index in plan["add"]:
+                        b = arm.data.edit_bones.new(plan["bone_name"])
+                        b.use_deform = False
+                        b.head = plan["chain_heads"][index]
+                        b.tail = plan["chain_tails"][index]
+                        plan["keep"][index] = b.name
+                    for bone_name in plan["remove"]:
+                        arm.data.edit_bones.remove(arm.data.edit_bones[bone_name])
+                
+            mustardtools_mode_set('POSE')
+            mustardtools_chain_index_invalidate(arm)
         
-        layout = self.layout
+        removed_ids = []
+        updated = 0
         
-        chain_bones = bpy.context.selected_pose_bones
+        with mustardtools_profile_phase("Update"):
+            for plan in plans:
+                
+                rig = mustardtools_rig_get(arm, plan["rig_id"])
+                curveOB = plan["curve"]
+                controllers = plan["controllers"]
+                controllers_names = [plan["keep"][index] for index in controllers]
+                # The curve is fit again if the controllers or the Fit Curve setting changed
+                changed = len(plan["add"]) > 0 or len(plan["remove"]) > 0 or rig.fit != settings.ik_spline_fit
+                
+                # Bendy bones
+                for bone_name in plan["chain_names"]:
+                    data_bone = arm.data.bones[bone_name]
+                    if data_bone.bbone_segments != bbone_segments:
+                        data_bone.bbone_segments = bbone_segments
+                        updated = updated + 1
+                
+                if changed:
+                    curveOB.data.splines.clear()
+                    polyline = curveOB.data.splines.new('BEZIER')
+                    polyline.bezier_points.add(num-1)
+                    mustardtools_ik_spline_curve_points(polyline, plan["chain_points"], controllers, settings.ik_spline_fit)
+                polyline = curveOB.data.splines[0]
+                
+                # Reuse the hook modifiers and empties of the kept controllers, and assign them to the new point indices
+                empties = []
+                hooks_used = set()
+                assignments = []
+                for i, bone_name in enumerate(controllers_names):
+                    
+                    hook_name, empty = plan["hooks"].get(bone_name, (None, None))
+                    hook = curveOB.modifiers.get(hook_name) if hook_name != None else None
+                    assign = changed
+                    
+                    if hook == None:
+                        hook = curveOB.modifiers.new(IKSpline_Hook_Modifier_Name, 'HOOK')
+                        assign = True
+                    
+                    if settings.ik_spline_bone_hooks:
+                        if hook.object != arm or hook.subtarget != bone_name:
+                            hook.object = arm
+                            hook.subtarget = bone_name
+                            assign = True
+                    else:
+                        if empty == None:
+                            empty = mustardtools_ik_spline_empty(IKSpline_Empty_Name, curveOB.matrix_world @ polyline.bezier_points[i].co, arm, bone_name, i == 0, bpy.context.collection)
+                        empties.append(empty)
+                        if hook.object != empty:
+                            hook.object = empty
+                            hook.subtarget = ""
+                            assign = True
+                    
+                    if assign:
+                        assignments.append((hook, i, arm.matrix_world @ arm.data.bones[bone_name].matrix_local))
+                    hooks_used.add(hook.name)
+                
+                mustardtools_ik_spline_hooks_assign(context, curveOB, assignments)
+                polyline = curveOB.data.splines[0]
+                
+                # Remove the hooks and the empties not used anymore
+                for hook_name, empty in plan["hooks"].values():
+                    if hook_name not in hooks_used and hook_name in curveOB.modifiers:
+                        curveOB.modifiers.remove(curveOB.modifiers[hook_name])
+                    if empty != None and empty not in empties:
+                        removed_ids.append(empty)
+                
+                updated = updated + mustardtools_ik_spline_shapes(arm, settings, controllers_names, empties)
+                
+                # Curve resolution
+                if settings.ik_spline_adaptive:
+                    chain_size = float(np.linalg.norm(np.diff(plan["chain_points"], axis=0), axis=1).sum())
+                    resolution = mustardtools_ik_spline_resolution(polyline, chain_size * settings.ik_spline_tolerance / 100.)
+                else:
+                    resolution = settings.ik_spline_resolution
+                if curveOB.data.resolution_u != resolution:
+                    curveOB.data.resolution_u = resolution
+                
+                # Update the registry
+                for bone_name in plan["remove"]:
+                    mustardtools_rig_remove_bone(rig, bone_name)
+                for index in plan["add"]:
+                    mustardtools_rig_add_bone(arm, rig, plan["keep"][index], 'CONTROLLER')
+                rig.empties.clear()
+                for empty in empties:
+                    mustardtools_rig_add_object(rig, empty)
+                rig.fit = settings.ik_spline_fit
+                
+                mustardtools_log_ik_spline.debug("Rig rebuilt with controllers on bones: %s, %d controllers added, %d removed", controllers, len(plan["add"]), len(plan["remove"]))
+            
+        with mustardtools_profile_phase("Objects removal"):
+            if len(removed_ids) > 0:
+                bpy.data.batch_remove(ids=removed_ids)
+            
+        if settings.ik_spline_bendy:
+            arm.data.display_type = "BBONE"
         
-        IK_num = 0
-        IK_num_nMUI = 0
-        for bone in chain_bones:
-            for constraint in bone.constraints:
-                if constraint.type == 'SPLINE_IK':
-                    IK_num = IK_num + 1
-                    if "MustardTools" not in constraint.name:
-                        IK_num_nMUI = IK_num_nMUI + 1
+        self.report({'INFO'}, 'MustardTools - ' + str(len(plans)) + ' IK spline rigs rebuilt: ' + str(sum(len(plan["add"]) for plan in plans)) + ' controllers added and ' + str(sum(len(plan["remove"]) for plan in plans)) + ' removed.')
         
-        box = layout.box()
-        box.prop(self, "delete_bones")
-        box.prop(self, "reset_bendy")
-        box = layout.box()
-        box.label(text="Will be removed:", icon="ERROR")
-        box.label(text="        - " + str(IK_num) + " Spline IK constraints.")
-        box.label(text="        - " + str(IK_num_nMUI) + " of which are not Mustard Tools generated.")
+        mustardtools_constraint_index_invalidate(arm)
+        
+        return {'FINISHED'}
 
 # ------------------------------------------------------------------------
 #    Slide Keyframes
@@ -881,269 +2548,466 @@ class MUSTARDTOOLS_OT_IKSpline_Clean(bpy.types.Operator):
 # This tool will scale from B to C and preserve the relations between the remaining keyframes: 
 # A ------ B --------------- C ------ D ------ E
 
-class MUSTARDTOOLS_OT_SlideKeyframes(bpy.types.Operator):
+# Read the keyframes of all the F-Curves of an action in NumPy buffers.
+# Each buffer is a tuple (fcurve, co, select), where co has a row with the flat array of keyframe coordinates
+# (followed by a row for the left and one for the right handles if requested),
+# and select the selection status of the control points
+def mustardtools_slide_keyframes_buffers(action, use_handles=True):
     
-    """Tool to scale keyframes, sliding the others accordingly"""
-    bl_idname = "mustardui.anim_slidekeyframes"
-    bl_label = "Slide Keyframes"
-    bl_options = {'REGISTER','UNDO','GRAB_CURSOR','BLOCKING'}
+    buffers = []
     
-    @classmethod
-    def poll(cls, context):
+    for fcurve in action.fcurves:
+        
+        keyframe_points = fcurve.keyframe_points
+        keyframes_num = len(keyframe_points)
+        if keyframes_num == 0:
+            continue
+        
+        co = np.empty((3 if use_handles else 1, 2 * keyframes_num), dtype=np.float32)
+        keyframe_points.foreach_get("co", co[0])
+        if use_handles:
+            keyframe_points.foreach_get("handle_left", co[1])
+            keyframe_points.foreach_get("handle_right", co[2])
+        select = np.empty(keyframes_num, dtype=bool)
+        keyframe_points.foreach_get("select_control_point", select)
+        
+        buffers.append((fcurve, co, select))
+    
+    return buffers
+
+# Compute the slid frames from the original ones.
+# Frames in the [start, end] range are scaled to [start, new_end], the frames after end are moved preserving their distance
+def mustardtools_slide_keyframes_map(frames, start, end, new_end):
+    
+    scale_factor = (new_end - start) / (end - start)
+    
+    return np.where(frames > end, frames + (new_end - end),
+                    np.where(frames >= start, start + (frames - start) * scale_factor, frames))
+
+# Scale factors for the left and right handles of the keyframes.
+# Handles are scaled only if they belong to a segment between two keyframes in the [start, end] range,
+# so that the handles outside it keep their shape
+def mustardtools_slide_keyframes_handles_scale(frames, start, end, new_end):
+    
+    scale_factor = (new_end - start) / (end - start)
+    
+    scale_left = np.where((frames > start) & (frames <= end), scale_factor, 1.)
+    scale_right = np.where((frames >= start) & (frames < end), scale_factor, 1.)
+    
+    return scale_left, scale_right
+
+# Concatenate the buffers of all the actions in a single array, so that the slide can be computed in one NumPy operation.
+# It returns the list of F-Curves, the concatenated coordinates and the offsets of each F-Curve in that array
+def mustardtools_slide_keyframes_concatenate(snapshot):
+    
+    fcurves = []
+    cos = []
+    
+    for action, buffers in snapshot:
+        for fcurve, co, select in buffers:
+            fcurves.append(fcurve)
+            cos.append(co)
+    
+    offsets = np.zeros(len(cos) + 1, dtype=np.int64)
+    if len(cos) > 0:
+        offsets[1:] = np.cumsum([co.shape[1] for co in cos])
+        co_all = np.concatenate(cos, axis=1)
+    else:
+        co_all = np.empty((3, 0), dtype=np.float32)
+    
+    return fcurves, co_all, offsets
+
+# Compute the slid coordinates and handles of the concatenated buffers co, storing them in co_slide.
+# Handles are moved together with their keyframe, preserving their shape
+def mustardtools_slide_keyframes_compute(co, co_slide, start, end, new_end):
+    
+    frames = co[0, 0::2]
+    frames_slide = mustardtools_slide_keyframes_map(frames, start, end, new_end)
+    scale_left, scale_right = mustardtools_slide_keyframes_handles_scale(frames, start, end, new_end)
+    
+    co_slide[0, 0::2] = frames_slide
+    co_slide[1, 0::2] = frames_slide + (co[1, 0::2] - frames) * scale_left
+    co_slide[2, 0::2] = frames_slide + (co[2, 0::2] - frames) * scale_right
+
+# Write the concatenated coordinates and handles back to the F-Curves (one foreach_set per F-Curve and property).
+# The F-Curves are updated once after all their keyframes have been written
+def mustardtools_slide_keyframes_write(fcurves, co_all, offsets):
+    
+    for i, fcurve in enumerate(fcurves):
+        keyframe_points = fcurve.keyframe_points
+        keyframe_points.foreach_set("co", co_all[0, offsets[i]:offsets[i+1]])
+        keyframe_points.foreach_set("handle_left", co_all[1, offsets[i]:offsets[i+1]])
+        keyframe_points.foreach_set("handle_right", co_all[2, offsets[i]:offsets[i+1]])
+        fcurve.update()
+
+# Keyframes before the starting point are never moved, so F-Curves with no keyframes after it can be skipped
+def mustardtools_slide_keyframes_filter(snapshot, start):
+    
+    return [(action, [(fcurve, co, select) for fcurve, co, select in buffers if co[0, 0::2].max() >= start])
+                for action, buffers in snapshot]
+
+# Slide the keyframes of a list of actions, without any UI interaction.
+# The keyframes in the [start, end] range are scaled to [start, new_end], the ones after end are moved accordingly.
+# This is the same engine used by the Slide Keyframes operator, and can be used in background scripts.
+# It returns the number of F-Curves that have been modified
+def mustardtools_slide_keyframes(actions, start, end, new_end):
+    
+    if end - start <= 0:
+        raise ValueError("MustardTools Slide Keyframes - The end frame should be greater than the start frame")
+    
+    new_end = max(new_end, start)
+    
+    # Remove duplicates, so that shared actions are slid only once
+    unique_actions = {}
+    for action in actions:
+        unique_actions.setdefault(action.as_pointer(), action)
+    
+    snapshot = [(action, mustardtools_slide_keyframes_buffers(action)) for action in unique_actions.values()]
+    fcurves, co, offsets = mustardtools_slide_keyframes_concatenate(mustardtools_slide_keyframes_filter(snapshot, start))
+    
+    co_slide = co.copy()
+    mustardtools_slide_keyframes_compute(co, co_slide, start, end, new_end)
+    mustardtools_slide_keyframes_write(fcurves, co_slide, offsets)
+    
+    for action in unique_actions.values():
+        action.update_tag()
+    mustardtools_slide_keyframes_index_invalidate(list(unique_actions.values()))
+    
+    return len(fcurves)
+
+# Objects considered by the Slide Keyframes tool, depending on the application setting
+def mustardtools_slide_keyframes_objects(context, settings):
+    
+    if settings.slide_keyframes_application == '0':
+        return [context.active_object]
+    elif settings.slide_keyframes_application == '1':
+        return context.selected_objects
+    else:
+        return bpy.data.objects
+
+# Actions animating an ID, optionally including the ones of its NLA strips
+def mustardtools_slide_keyframes_id_actions(id_data, use_nla):
+    
+    animation_data = getattr(id_data, "animation_data", None)
+    if animation_data == None:
+        return []
+    
+    actions = []
+    if animation_data.action != None:
+        actions.append(animation_data.action)
+    
+    if use_nla:
+        for track in animation_data.nla_tracks:
+            for strip in track.strips:
+                if strip.action != None:
+                    actions.append(strip.action)
+    
+    return actions
+
+# Unique actions of a set of objects, including the actions of the object data-blocks and shape keys.
+# Objects sharing the same action (e.g. linked duplicates) will result in a single action, so that it is slid only once
+def mustardtools_slide_keyframes_actions(objs, use_nla=False):
+    
+    actions = {}
+    
+    for obj in objs:
         
-        settings = bpy.context.scene.mustardtools_settings
+        if obj == None:
+            continue
         
-        if settings.slide_keyframes_application == '0':
+        id_datas = [obj, obj.data]
+        shape_keys = getattr(obj.data, "shape_keys", None)
+        if shape_keys != None:
+            id_datas.append(shape_keys)
         
-            obj = bpy.context.active_object
+        for id_data in id_datas:
+            for action in mustardtools_slide_keyframes_id_actions(id_data, use_nla):
+                actions.setdefault(action.as_pointer(), action)
+    
+    return list(actions.values())
+
+# Selection index cache
+# For every action (keyed by its pointer) it stores (number of selected keyframes, first selected frame, last selected frame).
+# The 'ALL' key stores the combined index of all the objects in the file, used by the 'All' application mode.
+# The cache is invalidated by depsgraph updates, msgbus notifications on keyframes selection and after undo/file load.
+# Some selection changes (e.g. the Dope Sheet select operators) only send notifiers, without depsgraph updates or msgbus
+# notifications, so the cache is also invalidated when an operator is run, comparing the last registered operator with
+# the one registered when the cache was filled
+mustardtools_slide_keyframes_index_cache = {}
+mustardtools_slide_keyframes_index_operator = None
+
+def mustardtools_slide_keyframes_index_build(buffers):
+    
+    count = 0
+    start = math.inf
+    end = - math.inf
+    
+    for fcurve, co, select in buffers:
+        selected_num = int(np.count_nonzero(select))
+        if selected_num > 0:
+            selected_frames = co[0, 0::2][select]
+            count += selected_num
+            start = min(start, float(selected_frames.min()))
+            end = max(end, float(selected_frames.max()))
+    
+    return (count, start, end)
+
+# Invalidate the cache if an operator was run since it was filled
+def mustardtools_slide_keyframes_index_validate(window_manager):
+    
+    global mustardtools_slide_keyframes_index_operator
+    
+    operators = window_manager.operators
+    operator = operators[-1].as_pointer() if len(operators) > 0 else None
+    if operator != mustardtools_slide_keyframes_index_operator:
+        mustardtools_slide_keyframes_index_cache.clear()
+        mustardtools_slide_keyframes_index_operator = operator
+
+def mustardtools_slide_keyframes_index(action):
+    
+    key = action.as_pointer()
+    
+    index = mustardtools_slide_keyframes_index_cache.get(key)
+    if index is None:
+        index = mustardtools_slide_keyframes_index_build(mustardtools_slide_keyframes_buffers(action, use_handles=False))
+        mustardtools_slide_keyframes_index_cache[key] = index
+    
+    return index
+
+# Combined selection index of the actions of a set of objects
+def mustardtools_slide_keyframes_range(objs, use_nla=False, use_cache_all=False):
+    
+    if use_cache_all and 'ALL' in mustardtools_slide_keyframes_index_cache:
+        return mustardtools_slide_keyframes_index_cache['ALL']
+    
+    count = 0
+    start = math.inf
+    end = - math.inf
+    
+    for action in mustardtools_slide_keyframes_actions(objs, use_nla):
         
-            if context.active_object == None:
-                if settings.ms_debug:
-                    print("MustardTools Slide Keyframes - No object selected")
-                return False
+        action_count, action_start, action_end = mustardtools_slide_keyframes_index(action)
+        if action_count > 0:
+            count += action_count
+            start = min(start, action_start)
+            end = max(end, action_end)
+    
+    if use_cache_all:
+        mustardtools_slide_keyframes_index_cache['ALL'] = (count, start, end)
+    
+    return (count, start, end)
+
+def mustardtools_slide_keyframes_index_invalidate(actions=None):
+    
+    if actions == None:
+        mustardtools_slide_keyframes_index_cache.clear()
+        return
+    
+    for action in actions:
+        mustardtools_slide_keyframes_index_cache.pop(action.as_pointer(), None)
+    mustardtools_slide_keyframes_index_cache.pop('ALL', None)
+
+# Interactive slide of the selected keyframes of a set of actions, used by the Slide Keyframes operator.
+# The snapshot of the original keyframes is taken when the session is created: every step computes the new positions
+# from it, so that no error is accumulated, and it is used to restore the keyframes if the slide is cancelled.
+# With coalesce, the steps are not applied at every move, but only the last pending one when flushed (e.g. by a timer)
+class MustardTools_SlideKeyframesSession:
+    
+    def __init__(self, actions, coalesce=False):
         
-            try:
-                action = obj.animation_data.action
-                
-                check = False
-                check_value = 0
-                    
-                for fcurve in action.fcurves:
-                    for p in fcurve.keyframe_points:
-                        if p.select_control_point:
-                            if check_value == 0:
-                                check_value = p.co[0]
-                                continue
-                            else:
-                                if p.co[0] != check_value:
-                                    check = True
-                                    break
-                
-                if not check and settings.ms_debug:
-                    print("MustardTools Slide Keyframes - The keyframe should belong to the object selected")
-                    
-                return check
-                
-            except:
-                if settings.ms_debug:
-                    print("MustardTools Slide Keyframes - No keyframes found on the object")
-                return False
+        self.start = math.inf
+        self.end = - math.inf
+        self.coalesce = coalesce
+        self.pending = None
         
-        elif settings.slide_keyframes_application == '1':
-            
-            objs = bpy.context.selected_objects
-            
-            if objs == []:
-                if settings.ms_debug:
-                    print("MustardTools Slide Keyframes - No object selected")
-                return False
+        # Snapshot of the original keyframes (per action, per F-Curve), only read by the steps
+        with mustardtools_profile_phase("Snapshot"):
+            snapshot = [(action, mustardtools_slide_keyframes_buffers(action)) for action in actions]
             
-            check = False
-            check_value = 0
+        # The selection index is refreshed from the snapshot, and used to find the range to slide
+        for action, buffers in snapshot:
+            for fcurve, co, select in buffers:
+                co.flags.writeable = False
+            count, start, end = mustardtools_slide_keyframes_index_build(buffers)
+            mustardtools_slide_keyframes_index_cache[action.as_pointer()] = (count, start, end)
+            if count > 0:
+                self.start = min(self.start, start)
+                self.end = max(self.end, end)
+        
+        self.end_scaled = self.end
+        
+        # The keyframes of all the actions are concatenated, to compute the slide with a single NumPy operation
+        with mustardtools_profile_phase("Concatenation"):
+            snapshot = mustardtools_slide_keyframes_filter(snapshot, self.start) if self.valid() else []
             
-            for obj in objs:
-                
-                try:
-                    action = obj.animation_data.action
-                    
-                    for fcurve in action.fcurves:
-                        for p in fcurve.keyframe_points:
-                            if p.select_control_point:
-                                if check_value == 0:
-                                    check_value = p.co[0]
-                                    continue
-                                else:
-                                    if p.co[0] != check_value:
-                                        check = True
-                                        break
-                    
-                except:
-                    if settings.ms_debug:
-                        print("MustardTools Slide Keyframes - Object "+obj.name+" neglected. No keyframes found")
-            
-            return check
+            self.actions = [action for action, buffers in snapshot]
+            self.fcurves, self.co, self.offsets = mustardtools_slide_keyframes_concatenate(snapshot)
+            self.co.flags.writeable = False
+            self.co_slide = self.co.copy()
+    
+    # The selected keyframes should be on at least two different frames
+    def valid(self):
         
-        elif settings.slide_keyframes_application == '2':
-            
-            objs = bpy.data.objects
-            
-            if objs == []:
-                if settings.ms_debug:
-                    print("MustardTools Slide Keyframes - No object in the scene")
-                return False
-            
-            for obj in objs:
-                
-                try:
-                    action = obj.animation_data.action
-                    
-                    check = False
-                    
-                    for fcurve in action.fcurves:
-                        for p in fcurve.keyframe_points:
-                            if p.select_control_point:
-                                check = True
-                                break
-                    
-                    return check
-                    
-                except:
-                    if settings.ms_debug:
-                        print("MustardTools Slide Keyframes - Object "+obj.name+" neglected. No keyframes found")
+        return self.end - self.start > 0
+    
+    # Tag the actions for the depsgraph update once all the F-Curves have been written
+    def update_tag(self):
         
-        return True
+        for action in self.actions:
+            action.update_tag()
     
-    def execute(self, context):
+    # Slide the end of the range to a new frame, or to the pending one if not specified
+    def step(self, new_end=None):
         
-        settings = bpy.context.scene.mustardtools_settings
+        if new_end == None:
+            new_end = self.pending
+        self.pending = None
         
-        if settings.slide_keyframes_application == '0':
-
-            obj = bpy.context.active_object
-            action = obj.animation_data.action
+        self.end_scaled = max(new_end, self.start)
         
-            self.action_end_scaled = self.value / 10.
-
-            for fcurve in action.fcurves:
-                for p in fcurve.keyframe_points:
-                    if p.co[0]>self.action_end:
-                        p.co[0] = p.co[0] + (self.action_end_scaled - self.action_end)
-            
-            if self.action_end - self.action_start > 0:
-                scale_factor = (self.action_end_scaled - self.action_end) / (self.action_end - self.action_start)
-                
-                for fcurve in action.fcurves:
-                    for p in fcurve.keyframe_points:
-                        if p.co[0]>=self.action_start and p.co[0]<=self.action_end:
-                            p.co[0] = p.co[0] + (p.co[0] - self.action_start) * scale_factor
-            else:
-                self.error = True
-            
-            self.action_end = self.action_end_scaled
+        with mustardtools_profile_phase("Slide compute"):
+            mustardtools_slide_keyframes_compute(self.co, self.co_slide, self.start, self.end, self.end_scaled)
+        with mustardtools_profile_phase("Slide write"):
+            mustardtools_slide_keyframes_write(self.fcurves, self.co_slide, self.offsets)
+        with mustardtools_profile_phase("Slide update"):
+            self.update_tag()
+    
+    # Move the end of the range. Returns True if the step should be applied now, False if it is left pending
+    def move(self, new_end):
         
-        else:
+        self.pending = new_end
         
-            if settings.slide_keyframes_application == '1':
-                objs = bpy.context.selected_objects
-            else:
-                objs = bpy.data.objects
-            
-            self.action_end_scaled = self.value / 10.
-            
-            for obj in objs:
-                
-                try:
-                    action = obj.animation_data.action
+        return not self.coalesce
+    
+    # Restore the keyframes as they were before the slide
+    def restore(self):
+        
+        self.pending = None
+        mustardtools_slide_keyframes_write(self.fcurves, self.co, self.offsets)
+        self.update_tag()
+    
+    # The slid keyframes are kept, and the selection index is computed again when needed
+    def confirm(self):
+        
+        mustardtools_slide_keyframes_index_invalidate(self.actions)
 
-                    for fcurve in action.fcurves:
-                        for p in fcurve.keyframe_points:
-                            if p.co[0]>self.action_end:
-                                p.co[0] = p.co[0] + (self.action_end_scaled - self.action_end)
-            
-                    if self.action_end - self.action_start > 0:
-                        scale_factor = (self.action_end_scaled - self.action_end) / (self.action_end - self.action_start)
-                
-                        for fcurve in action.fcurves:
-                            for p in fcurve.keyframe_points:
-                                if p.co[0]>=self.action_start and p.co[0]<=self.action_end:
-                                    p.co[0] = p.co[0] + (p.co[0] - self.action_start) * scale_factor
-                    else:
-                        self.error = True
-                        break
-                
-                except:
-                    continue
-            
-            self.action_end = self.action_end_scaled
+class MUSTARDTOOLS_OT_SlideKeyframes(bpy.types.Operator):
+    
+    """Tool to scale keyframes, sliding the others accordingly"""
+    bl_idname = "mustardui.anim_slidekeyframes"
+    bl_label = "Slide Keyframes"
+    bl_options = {'REGISTER','UNDO','GRAB_CURSOR','BLOCKING'}
+    
+    @classmethod
+    def poll(cls, context):
+        
+        settings = bpy.context.scene.mustardtools_settings
+        
+        if settings.slide_keyframes_application == '0' and context.active_object == None:
+            mustardtools_log_slide.debug("No object selected")
+            return False
+        
+        # The selection index is cached, so this is only a lookup while the keyframes are not changed
+        mustardtools_slide_keyframes_index_validate(context.window_manager)
+        count, start, end = mustardtools_slide_keyframes_range(mustardtools_slide_keyframes_objects(context, settings),
+                                                                settings.slide_keyframes_nla,
+                                                                settings.slide_keyframes_application == '2')
+        
+        return end > start
+    
+    # Apply the pending step of the slide
+    @mustardtools_profile
+    def execute(self, context):
+        
+        self.session.step()
+        
+        if context.area != None:
+            context.area.tag_redraw()
         
         return {'FINISHED'}
     
-    def modal(self, context, event):
+    # Remove the timer used to coalesce the updates
+    def finish(self, context):
         
-        settings = bpy.context.scene.mustardtools_settings
+        if self.timer != None:
+            context.window_manager.event_timer_remove(self.timer)
+            self.timer = None
+    
+    # Restore the keyframes and remove the timer, when the slide is cancelled by the user or by Blender
+    # (e.g. when the window is closed or a file is loaded)
+    def cancel(self, context):
+        
+        self.finish(context)
+        self.session.restore()
+        if context.area != None:
+            context.area.tag_redraw()
+    
+    def modal(self, context, event):
         
-        if self.error:
-            self.report({'ERROR'}, 'MustardTools - Cannot slide those keyframes. Undo and retry.')
+        # The keyframes are never left partially slid: if any step fails the slide is cancelled
+        try:
+            return self.modal_event(context, event)
+        except Exception:
+            mustardtools_log_slide.exception("Slide failed, restoring the keyframes")
+            self.cancel(context)
+            self.report({'ERROR'}, 'MustardTools - Slide cancelled because of an error. Check the console for more information.')
             return {'CANCELLED'}
+    
+    def modal_event(self, context, event):
         
         if event.type == 'MOUSEMOVE':  # Apply
             if (event.mouse_prev_x != event.mouse_x):
-                self.value = event.mouse_region_x
+                # With coalesced updates, only the last position is applied by the timer
+                if self.session.move(event.mouse_region_x / 10.):
+                    self.execute(context)
+        
+        elif event.type == 'TIMER':  # Apply coalesced updates
+            if self.session.pending != None:
                 self.execute(context)
         
         elif event.type == 'LEFTMOUSE':  # Confirm
+            if self.session.pending != None:
+                self.execute(context)
+            self.finish(context)
+            self.session.confirm()
             self.report({'INFO'}, 'MustardTools - Slide complete.')
-            if settings.ms_debug:
-                scale_factor = 1. + (self.action_end_scaled - self.init_action_end) / (self.init_action_end - self.action_start)
-                print("MustardTools Slide Keyframes - Scaling with factor " + str(scale_factor))
+            mustardtools_log_slide.debug("Scaling with factor %f", (self.session.end_scaled - self.session.start) / (self.session.end - self.session.start))
             return {'FINISHED'}
         
         elif event.type in {'RIGHTMOUSE', 'ESC'}:  # Cancel
-            self.report({'INFO'}, 'MustardTools - Undo to cancel.')   
+            self.cancel(context)
+            self.report({'INFO'}, 'MustardTools - Slide cancelled.')
             return {'CANCELLED'}
 
         return {'RUNNING_MODAL'}
     
+    @mustardtools_profile
     def invoke(self, context, event):
         
         settings = bpy.context.scene.mustardtools_settings
         
-        self.error = False
-        
-        self.action_start = 1048574
-        self.action_end = - 1048574
+        # Actions shared by more objects are considered only once
+        objs = mustardtools_slide_keyframes_objects(context, settings)
+        actions = mustardtools_slide_keyframes_actions(objs, settings.slide_keyframes_nla)
         
-        if settings.slide_keyframes_application == '0':
+        mustardtools_log_slide.debug("%d actions found on %d objects", len(actions), len(objs))
         
-            obj = bpy.context.active_object
-            action = obj.animation_data.action
-            
-            for fcurve in action.fcurves:
-                for p in fcurve.keyframe_points:
-                    if p.select_control_point and self.action_start > p.co[0]:
-                        self.action_start = p.co[0]
-                    if p.select_control_point and self.action_end < p.co[0]:
-                        self.action_end = p.co[0]
-            if settings.ms_debug:
-                print("MustardTools Slide Keyframes - Starting point found at " + str(self.action_start))
-                print("MustardTools Slide Keyframes - Ending point found at " + str(self.action_start))
-            
-            self.init_action_end = self.action_end
-            
-            self.action_end_scaled = self.action_end
+        self.session = MustardTools_SlideKeyframesSession(actions, settings.slide_keyframes_coalesce)
         
-        else:
+        mustardtools_log_slide.debug("Starting point found at %f, ending point found at %f", self.session.start, self.session.end)
         
-            if settings.slide_keyframes_application == '1':
-                objs = bpy.context.selected_objects
-            else:
-                objs = bpy.data.objects
-            
-            for obj in objs:
-                
-                try:
-                    action = obj.animation_data.action
-                    
-                    for fcurve in action.fcurves:
-                        for p in fcurve.keyframe_points:
-                            if p.select_control_point and self.action_start > p.co[0]:
-                                self.action_start = p.co[0]
-                            if p.select_control_point and self.action_end < p.co[0]:
-                                self.action_end = p.co[0]
-                    if settings.ms_debug:
-                        print("MustardTools Slide Keyframes - Starting point found at " + str(self.action_start))
-                        print("MustardTools Slide Keyframes - Ending point found at " + str(self.action_start))
-                    
-                    self.init_action_end = self.action_end
-                    
-                    self.action_end_scaled = self.action_end
-                
-                except:
-                    if settings.ms_debug:
-                        print("MustardTools Slide Keyframes - Object "+obj.name+" neglected. No keyframes found")
+        if not self.session.valid():
+            self.report({'ERROR'}, 'MustardTools - Cannot slide those keyframes. Select keyframes on at least two different frames.')
+            return {'CANCELLED'}
         
-        self.value = event.mouse_region_x
+        self.session.move(event.mouse_region_x / 10.)
         self.execute(context)
+        
+        # Timer to apply at most one update per redraw, instead of one per mouse event
+        if settings.slide_keyframes_coalesce:
+            self.timer = context.window_manager.event_timer_add(1. / settings.slide_keyframes_coalesce_rate, window=context.window)
+        else:
+            self.timer = None
 
         context.window_manager.modal_handler_add(self)
         return {'RUNNING_MODAL'}
@@ -1151,6 +3015,85 @@ class MUSTARDTOOLS_OT_SlideKeyframes(bpy.types.Operator):
     def draw(self, context):
         self.layout.operator("message.messagebox", text = "message").message = 'Sample Text'
 
+# ------------------------------------------------------------------------
+#    Slide Keyframes (background)
+# ------------------------------------------------------------------------
+#
+# Command line usage, on the currently opened file:
+#   blender -b shot.blend --python-expr "import mustard_tools; mustard_tools.mustardtools_slide_keyframes_cli()" -- --start 10 --end 20 --new-end 30 --save
+# or on many files, each processed by a separate Blender process:
+#   blender -b --python-expr "import mustard_tools; mustard_tools.mustardtools_slide_keyframes_cli()" -- --start 10 --end 20 --new-end 30 --jobs 8 shot1.blend shot2.blend
+# If no action is specified with --actions, all the actions in the file are slid.
+
+def mustardtools_slide_keyframes_cli_parser():
+    
+    parser = argparse.ArgumentParser(prog="mustardtools_slide_keyframes",
+                                    description="MustardTools Slide Keyframes - Scale the [start, end] frame range to [start, new-end], sliding the following keyframes")
+    parser.add_argument("--start", type=float, required=True, help="First frame of the range to scale")
+    parser.add_argument("--end", type=float, required=True, help="Last frame of the range to scale")
+    parser.add_argument("--new-end", type=float, required=True, help="New last frame of the range")
+    parser.add_argument("--actions", nargs="+", default=None, help="Names of the actions to slide (default: all the actions)")
+    parser.add_argument("--save", action="store_true", help="Save the file after the slide")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of Blender processes used when processing many files (default: number of cores)")
+    parser.add_argument("files", nargs="*", help="Files to process. If empty, the currently opened file is processed")
+    
+    return parser
+
+def mustardtools_slide_keyframes_cli(argv=None):
+    
+    # Blender arguments are separated from the script ones with --
+    if argv == None:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    
+    args = mustardtools_slide_keyframes_cli_parser().parse_args(argv)
+    
+    if args.files:
+        results = mustardtools_slide_keyframes_batch(args.files, args.start, args.end, args.new_end,
+                                                    actions=args.actions, jobs=args.jobs)
+        failed = [filepath for filepath, returncode in results if returncode != 0]
+        for filepath in failed:
+            print("MustardTools Slide Keyframes - Error while processing " + filepath)
+        print("MustardTools Slide Keyframes - " + str(len(results) - len(failed)) + " of " + str(len(results)) + " files processed")
+        return 1 if failed else 0
+    
+    if args.actions != None:
+        actions = [bpy.data.actions[name] for name in args.actions]
+    else:
+        actions = list(bpy.data.actions)
+    
+    fcurves_num = mustardtools_slide_keyframes(actions, args.start, args.end, args.new_end)
+    print("MustardTools Slide Keyframes - " + str(fcurves_num) + " F-Curves slid in " + bpy.data.filepath)
+    
+    if args.save:
+        bpy.ops.wm.save_mainfile()
+    
+    return 0
+
+# Slide the keyframes of many files, each one processed by a background Blender process.
+# It returns a list of (filepath, return code) tuples
+def mustardtools_slide_keyframes_batch(filepaths, start, end, new_end, actions=None, jobs=None, blender=None):
+    
+    if blender == None:
+        blender = bpy.app.binary_path
+    if jobs == None:
+        jobs = os.cpu_count() or 1
+    
+    # Make sure this module can be imported by the worker processes
+    expr = ("import sys; sys.path.insert(0, " + repr(os.path.dirname(os.path.abspath(__file__))) + "); "
+            "import mustard_tools; sys.exit(mustard_tools.mustardtools_slide_keyframes_cli())")
+    
+    script_args = ["--start", str(start), "--end", str(end), "--new-end", str(new_end), "--save"]
+    if actions != None:
+        script_args += ["--actions"] + list(actions)
+    
+    def process(filepath):
+        command = [blender, "-b", filepath, "--python-exit-code", "1", "--python-expr", expr, "--"] + script_args
+        return (filepath, subprocess.run(command, stdout=subprocess.DEVNULL).returncode)
+    
+    # Threads only wait for the Blender processes, so the work scales with the number of cores
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(process, filepaths))
+
 # ------------------------------------------------------------------------
 #    OptiX compatibility
 # ------------------------------------------------------------------------
@@ -1167,17 +3110,25 @@ class MUSTARDTOOLS_OT_OptiXCompatibility(bpy.types.Operator):
         default=False
     )
     
+    @mustardtools_profile
     def execute(self, context):
         
-        for mat in bpy.data.materials:
-            if mat.use_nodes:
-                nodes = mat.node_tree.nodes
-                for node in nodes:
-                    if isinstance(node, bpy.types.ShaderNodeAmbientOcclusion):
-                        node.mute = not self.revert
-                    elif isinstance(node, bpy.types.ShaderNodeBevel):
-                        node.mute = not self.revert
-            
+        nodes_num = 0
+        
+        with mustardtools_profile_phase("Materials"):
+            for mat in bpy.data.materials:
+                if mat.use_nodes:
+                    nodes = mat.node_tree.nodes
+                    for node in nodes:
+                        if isinstance(node, bpy.types.ShaderNodeAmbientOcclusion):
+                            node.mute = not self.revert
+                            nodes_num = nodes_num + 1
+                        elif isinstance(node, bpy.types.ShaderNodeBevel):
+                            node.mute = not self.revert
+                            nodes_num = nodes_num + 1
+        
+        mustardtools_log_optix.debug("%d nodes %s in %d materials", nodes_num, "enabled" if self.revert else "muted", len(bpy.data.materials))
+        
         return {'FINISHED'}
     
     def draw(self, context):
@@ -1194,6 +3145,75 @@ class MUSTARDTOOLS_OT_OptiXCompatibility(bpy.types.Operator):
             box.label(text="        - Muting AO nodes from all materials.")
             box.label(text="        - Muting Bevel nodes from all materials.")
 
+# ------------------------------------------------------------------------
+#    Caches invalidation
+# ------------------------------------------------------------------------
+#
+# The chain resolution index, the constraints index and the Slide Keyframes selection index are invalidated
+# by the same handlers: depsgraph updates, msgbus notifications, and undo/redo or file load.
+
+mustardtools_cache_msgbus_owner = object()
+
+def mustardtools_cache_invalidate():
+    
+    mustardtools_chain_index_invalidate()
+    mustardtools_constraint_index_invalidate()
+    mustardtools_slide_keyframes_index_invalidate()
+
+@persistent
+def mustardtools_cache_depsgraph_update(scene, depsgraph=None):
+    
+    if not mustardtools_chain_index_cache and not mustardtools_constraint_index_cache and not mustardtools_slide_keyframes_index_cache:
+        return
+    
+    # The depsgraph is passed to the handlers only from Blender 2.91
+    if depsgraph == None:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+    
+    actions = []
+    for update in depsgraph.updates:
+        updated_id = update.id.original
+        
+        if isinstance(updated_id, bpy.types.Armature):
+            mustardtools_chain_index_cache.pop(updated_id.as_pointer(), None)
+            mustardtools_constraint_index_invalidate_data(updated_id)
+        elif isinstance(updated_id, bpy.types.Object) and updated_id.type == 'ARMATURE':
+            mustardtools_constraint_index_invalidate(updated_id)
+        
+        if mustardtools_slide_keyframes_index_cache:
+            if isinstance(updated_id, bpy.types.Action):
+                actions.append(updated_id)
+            else:
+                actions.extend(mustardtools_slide_keyframes_id_actions(updated_id, True))
+    
+    # Objects might have been added or removed, so the combined Slide Keyframes index is always invalidated
+    if mustardtools_slide_keyframes_index_cache:
+        mustardtools_slide_keyframes_index_invalidate(actions)
+
+@persistent
+def mustardtools_cache_reset(*args):
+    
+    # Pointers are not valid anymore after undo or file load
+    mustardtools_cache_invalidate()
+
+def mustardtools_cache_msgbus_callback(invalidate):
+    
+    invalidate()
+
+@persistent
+def mustardtools_cache_msgbus_subscribe(*args):
+    
+    bpy.msgbus.clear_by_owner(mustardtools_cache_msgbus_owner)
+    
+    for key, invalidate in [((bpy.types.KinematicConstraint, "pole_subtarget"), mustardtools_constraint_index_invalidate),
+                            ((bpy.types.KinematicConstraint, "pole_target"), mustardtools_constraint_index_invalidate),
+                            ((bpy.types.Keyframe, "select_control_point"), mustardtools_slide_keyframes_index_invalidate),
+                            ((bpy.types.Keyframe, "co"), mustardtools_slide_keyframes_index_invalidate)]:
+        bpy.msgbus.subscribe_rna(key=key,
+                                owner=mustardtools_cache_msgbus_owner,
+                                args=(invalidate,),
+                                notify=mustardtools_cache_msgbus_callback)
+
 # ------------------------------------------------------------------------
 #    UI
 # ------------------------------------------------------------------------
@@ -1216,6 +3236,8 @@ class MUSTARDTOOLS_PT_IKChain(MainPanel, bpy.types.Panel):
         
         box=layout.box()
         box.label(text="Main settings", icon="CON_KINEMATIC")
+        box.prop(settings,"ik_chain_multi")
+        box.prop(settings,"ik_chain_symmetry")
         box.prop(settings,"ik_chain_last_bone_use")
         box.prop(settings,"ik_chain_bendy")
         col=box.column()
@@ -1226,15 +3248,21 @@ class MUSTARDTOOLS_PT_IKChain(MainPanel, bpy.types.Panel):
         row.label(text="Shape")
         row.scale_x = 3.
         row.prop(settings,"ik_chain_last_bone_custom_shape")
-        layout.operator('mustardui.ik_chain', icon="ADD")
+        row=layout.row(align=True)
+        row.operator('mustardui.ik_chain', icon="ADD")
+        row.operator('mustardui.ik_chainrebuild', icon="FILE_REFRESH")
         box=layout.box()
         box.label(text="Pole settings", icon="SHADING_WIRE")
-        box.prop(settings,"ik_chain_pole_angle")
+        box.prop(settings,"ik_chain_pole_auto")
+        if settings.ik_chain_pole_auto:
+            box.prop(settings,"ik_chain_pole_distance")
+        else:
+            box.prop(settings,"ik_chain_pole_angle")
         row=box.row()
         row.label(text="Shape")
         row.scale_x = 3.
         row.prop(settings,"ik_chain_pole_bone_custom_shape")
-        if not settings.ik_chain_pole_status:
+        if settings.ik_chain_pole_auto or not settings.ik_chain_pole_status:
             layout.operator('mustardui.ik_chainpole', icon="ADD").status = True
         else:
             row=box.row(align=True)
@@ -1256,8 +3284,15 @@ class MUSTARDTOOLS_PT_IKSpline(MainPanel, bpy.types.Panel):
         box=layout.box()
         box.label(text="Main settings", icon="CON_SPLINEIK")
         box.prop(settings,"ik_spline_number")
+        box.prop(settings,"ik_spline_symmetry")
+        box.prop(settings,"ik_spline_bone_hooks")
+        box.prop(settings,"ik_spline_adaptive")
+        box.prop(settings,"ik_spline_fit")
         if settings.ms_advanced:
-            box.prop(settings,"ik_spline_resolution")
+            if settings.ik_spline_adaptive:
+                box.prop(settings,"ik_spline_tolerance")
+            else:
+                box.prop(settings,"ik_spline_resolution")
         box.prop(settings,"ik_spline_bendy")
         col=box.column()
         if not settings.ik_spline_bendy:
@@ -1274,7 +3309,9 @@ class MUSTARDTOOLS_PT_IKSpline(MainPanel, bpy.types.Panel):
             row.scale_x = 3.
             row.prop(settings,"ik_spline_bone_custom_shape")
         
-        layout.operator('mustardui.ik_spline', icon="ADD")
+        row=layout.row(align=True)
+        row.operator('mustardui.ik_spline', icon="ADD")
+        row.operator('mustardui.ik_splinerebuild', icon="FILE_REFRESH")
         
         layout.separator()
         layout.operator('mustardui.ik_splineclean', icon="CANCEL")
@@ -1308,6 +3345,24 @@ class MUSTARDTOOLS_PT_Settings(MainPanel, bpy.types.Panel):
         box.label(text="Main Settings", icon="SETTINGS")
         box.prop(settings,"ms_advanced")
         box.prop(settings,"ms_debug")
+        if settings.ms_debug:
+            box.prop(settings,"ms_debug_log_file")
+        box.prop(settings,"ms_profiling")
+        
+        if settings.ms_profiling:
+            box=layout.box()
+            box.label(text="Profiling", icon="TIME")
+            if len(mustardtools_profile_records) > 0:
+                col=box.column(align=True)
+                for key, records in mustardtools_profile_records.items():
+                    stats = mustardtools_profile_stats(records)["Total"]
+                    col.label(text=key + " (" + str(len(records)) + " runs)")
+                    col.label(text="        p50: " + str(round(stats["p50"], 2)) + " ms, p95: " + str(round(stats["p95"], 2)) + " ms")
+            else:
+                box.label(text="No operator run recorded yet.")
+            row=box.row(align=True)
+            row.operator('mustardui.profile_export', icon="EXPORT")
+            row.operator('mustardui.profile_clear', icon="X")
         
         box=layout.box()
         box.label(text="Slide Keyframes Settings", icon="SETTINGS")
@@ -1315,6 +3370,13 @@ class MUSTARDTOOLS_PT_Settings(MainPanel, bpy.types.Panel):
         row.label(text="Application")
         row.scale_x = 2.
         row.prop(settings,"slide_keyframes_application")
+        box.prop(settings,"slide_keyframes_nla")
+        box.prop(settings,"slide_keyframes_coalesce")
+        if settings.ms_advanced:
+            col=box.column()
+            if not settings.slide_keyframes_coalesce:
+                col.enabled=False
+            col.prop(settings,"slide_keyframes_coalesce_rate")
         
         box=layout.box()
         box.label(text="Objects Naming Convention",icon="OUTLINER_OB_FONT")
@@ -1331,13 +3393,17 @@ classes = (
     MUSTARDTOOLS_OT_IKChain,
     MUSTARDTOOLS_OT_IKChain_Pole,
     MUSTARDTOOLS_OT_IKChain_Clean,
+    MUSTARDTOOLS_OT_IKChain_Rebuild,
     MUSTARDTOOLS_PT_IKChain,
     MUSTARDTOOLS_OT_IKSpline,
     MUSTARDTOOLS_OT_IKSpline_Clean,
+    MUSTARDTOOLS_OT_IKSpline_Rebuild,
     MUSTARDTOOLS_PT_IKSpline,
     MUSTARDTOOLS_OT_SlideKeyframes,
     MUSTARDTOOLS_OT_OptiXCompatibility,
     MUSTARDTOOLS_PT_VariousTools,
+    MUSTARDTOOLS_OT_ProfileExport,
+    MUSTARDTOOLS_OT_ProfileClear,
     MUSTARDTOOLS_PT_Settings
 )
 
@@ -1350,9 +3416,23 @@ def register():
         register_class(cls)
         
     wm = bpy.context.window_manager ### register the keymap
-    km = wm.keyconfigs.addon.keymaps.new(name='Dopesheet', space_type='DOPESHEET_EDITOR')
-    kmi = km.keymap_items.new(MUSTARDTOOLS_OT_SlideKeyframes.bl_idname, 'S', 'PRESS', shift=True, ctrl=False, alt=True)
-    addon_keymaps.append((km, kmi))
+    # The addon keyconfig is not available in background (e.g. in the benchmark script)
+    if wm.keyconfigs.addon != None:
+        km = wm.keyconfigs.addon.keymaps.new(name='Dopesheet', space_type='DOPESHEET_EDITOR')
+        kmi = km.keymap_items.new(MUSTARDTOOLS_OT_SlideKeyframes.bl_idname, 'S', 'PRESS', shift=True, ctrl=False, alt=True)
+        addon_keymaps.append((km, kmi))
+    
+    # Handlers to invalidate the caches
+    bpy.app.handlers.depsgraph_update_post.append(mustardtools_cache_depsgraph_update)
+    bpy.app.handlers.undo_post.append(mustardtools_cache_reset)
+    bpy.app.handlers.redo_post.append(mustardtools_cache_reset)
+    bpy.app.handlers.load_post.append(mustardtools_cache_reset)
+    bpy.app.handlers.load_post.append(mustardtools_cache_msgbus_subscribe)
+    mustardtools_cache_msgbus_subscribe()
+    
+    # Handlers to restore the debug and profiling status from the loaded file
+    bpy.app.handlers.load_post.append(mustardtools_log_load)
+    bpy.app.handlers.load_post.append(mustardtools_profile_load)
 
 def unregister():
     
@@ -1363,6 +3443,20 @@ def unregister():
     for km, kmi in addon_keymaps:
         km.keymap_items.remove(kmi)
     addon_keymaps.clear()
+    
+    bpy.app.handlers.depsgraph_update_post.remove(mustardtools_cache_depsgraph_update)
+    bpy.app.handlers.undo_post.remove(mustardtools_cache_reset)
+    bpy.app.handlers.redo_post.remove(mustardtools_cache_reset)
+    bpy.app.handlers.load_post.remove(mustardtools_cache_reset)
+    bpy.app.handlers.load_post.remove(mustardtools_cache_msgbus_subscribe)
+    bpy.msgbus.clear_by_owner(mustardtools_cache_msgbus_owner)
+    mustardtools_cache_invalidate()
+    
+    bpy.app.handlers.load_post.remove(mustardtools_log_load)
+    mustardtools_log_configure(False)
+    
+    bpy.app.handlers.load_post.remove(mustardtools_profile_load)
+    mustardtools_profile_reset()
 
 if __name__ == "__main__":
     register()
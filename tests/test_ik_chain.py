@@ -0,0 +1,117 @@
+# Mustard Tools tests - IK Chain
+# https://github.com/Mustard2/MustardTools
+#
+# Tests of the IK Chain pole angle, symmetric names and polls, to be run in background:
+#   blender -b --factory-startup --python tests/test_ik_chain.py
+
+import bpy
+import sys
+import os
+import math
+import unittest
+from mathutils import Vector
+
+# The addon is imported from the parent folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mustard_tools
+
+def setUpModule():
+    mustard_tools.register()
+
+def tearDownModule():
+    mustard_tools.unregister()
+
+class TestPoleAngle(unittest.TestCase):
+    
+    # A chain along the Y axis, with the first bone X axis along the X axis
+    base_head = Vector((0., 0., 0.))
+    base_tail = Vector((0., 1., 0.))
+    base_x_axis = Vector((1., 0., 0.))
+    ik_tail = Vector((0., 2., 0.))
+    
+    def pole_angle(self, pole_location):
+        
+        return mustard_tools.mustardtools_ik_pole_angle(self.base_head, self.base_tail, self.base_x_axis, self.ik_tail, Vector(pole_location))
+    
+    def test_angle(self):
+        self.assertAlmostEqual(self.pole_angle((0., 1., 1.)), math.pi / 2)
+        self.assertAlmostEqual(self.pole_angle((0., 1., -1.)), - math.pi / 2)
+    
+    # A pole aligned with the chain gives zero length vectors
+    def test_pole_aligned(self):
+        self.assertEqual(self.pole_angle((0., 1., 0.)), 0.)
+        self.assertEqual(self.pole_angle((0., 3., 0.)), 0.)
+
+class TestMirrorName(unittest.TestCase):
+    
+    def test_sides(self):
+        for name, mirror in [("Arm.L", "Arm.R"), ("Arm_r.001", "Arm_l.001"), ("L_Arm", "R_Arm"),
+                             ("LeftArm", "RightArm"), ("ArmRight", "ArmLeft"), ("Arm_left", "Arm_right"),
+                             ("LEFT_ARM", "RIGHT_ARM"), ("Hand.Right.001", "Hand.Left.001"), ("Bright.L", "Bright.R")]:
+            with self.subTest(name=name):
+                self.assertEqual(mustard_tools.mustardtools_mirror_name(name), mirror)
+    
+    # Side words inside other words are not sides
+    def test_inside_words(self):
+        for name in ["Bright", "Upright", "Leftover", "BRIGHT", "Copyright.001"]:
+            with self.subTest(name=name):
+                self.assertEqual(mustard_tools.mustardtools_mirror_name(name), None)
+
+# The polls are updated when constraints are added or removed outside of the tools
+class TestPoll(unittest.TestCase):
+    
+    # A chain of 3 connected bones, all selected
+    def setUp(self):
+        
+        if bpy.context.object != None and bpy.context.object.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        bpy.data.batch_remove(ids=list(bpy.data.objects) + list(bpy.data.armatures))
+        mustard_tools.mustardtools_cache_invalidate()
+        
+        data = bpy.data.armatures.new("Test")
+        self.arm = bpy.data.objects.new("Test", data)
+        bpy.context.scene.collection.objects.link(self.arm)
+        bpy.context.view_layer.objects.active = self.arm
+        self.arm.select_set(True)
+        
+        bpy.ops.object.mode_set(mode='EDIT')
+        parent = None
+        for i in range(0, 3):
+            bone = data.edit_bones.new("Bone" + str(i))
+            bone.head = (0., 0.1 * i, 0.)
+            bone.tail = (0., 0.1 * (i+1), 0.)
+            bone.parent = parent
+            bone.use_connect = parent != None
+            parent = bone
+        bpy.ops.object.mode_set(mode='POSE')
+        
+        for bone in data.bones:
+            bone.select = True
+        bpy.context.view_layer.update()
+    
+    def test_constraint_added(self):
+        
+        self.assertTrue(bpy.ops.mustardui.ik_chain.poll())
+        self.assertFalse(bpy.ops.mustardui.ik_chainclean.poll())
+        
+        constraint = self.arm.pose.bones["Bone2"].constraints.new('IK')
+        bpy.context.view_layer.update()
+        self.assertFalse(bpy.ops.mustardui.ik_chain.poll())
+        self.assertTrue(bpy.ops.mustardui.ik_chainclean.poll())
+        
+        self.arm.pose.bones["Bone2"].constraints.remove(constraint)
+        bpy.context.view_layer.update()
+        self.assertTrue(bpy.ops.mustardui.ik_chain.poll())
+    
+    def test_selection_changed(self):
+        
+        self.assertTrue(bpy.ops.mustardui.ik_chain.poll())
+        
+        for bone in self.arm.data.bones:
+            bone.select = False
+        bpy.context.view_layer.update()
+        self.assertFalse(bpy.ops.mustardui.ik_chain.poll())
+
+if __name__ == "__main__":
+    result = unittest.main(argv=[__file__], exit=False).result
+    sys.exit(0 if result.wasSuccessful() else 1)
@@ -0,0 +1,159 @@
+# Mustard Tools tests - IK Spline
+# https://github.com/Mustard2/MustardTools
+#
+# Tests of the IK Spline controllers placement and rigs, to be run in background:
+#   blender -b --factory-startup --python tests/test_ik_spline.py
+
+import bpy
+import sys
+import os
+import math
+import unittest
+import numpy as np
+
+# The addon is imported from the parent folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mustard_tools
+
+def setUpModule():
+    mustard_tools.register()
+
+def tearDownModule():
+    mustard_tools.unregister()
+
+# Points of a chain with the specified number of bones along a sine wave (bone heads followed by the tail of the last bone)
+def sine_chain(chain_length, amplitude, frequency):
+    
+    i = np.arange(chain_length + 1)
+    return np.stack([np.zeros(chain_length + 1), 0.1 * i, amplitude * np.sin(frequency * i)], axis=1)
+
+class TestControllersAdaptive(unittest.TestCase):
+    
+    # (chain length, amplitude, frequency, controllers)
+    chains = [(20, 0.05, 0.5, 3),
+              (20, 0.5, 0.9, 5),
+              (20, 0.3, 0.3, 4),
+              (50, 0.2, 0.4, 6),
+              (100, 0.05, 0.5, 10),
+              (4, 0.1, 1., 3)]
+    
+    def test_not_worse_than_even(self):
+        for chain_length, amplitude, frequency, num in self.chains:
+            for fit in (True, False):
+                with self.subTest(chain_length=chain_length, amplitude=amplitude, frequency=frequency, num=num, fit=fit):
+                    points = sine_chain(chain_length, amplitude, frequency)
+                    adaptive = mustard_tools.mustardtools_ik_spline_controllers_adaptive(points, num, fit)
+                    even = mustard_tools.mustardtools_ik_spline_controllers(chain_length, num)
+                    
+                    self.assertLessEqual(mustard_tools.mustardtools_ik_spline_fit_error(points, adaptive, fit),
+                                         mustard_tools.mustardtools_ik_spline_fit_error(points, even, fit))
+    
+    # The curve scored without Fit Curve is the one built with AUTO handles
+    def test_auto_handles(self):
+        for chain_length, amplitude, frequency, num in self.chains:
+            with self.subTest(chain_length=chain_length, amplitude=amplitude, frequency=frequency, num=num):
+                points = sine_chain(chain_length, amplitude, frequency)
+                controllers = mustard_tools.mustardtools_ik_spline_controllers(chain_length, num)
+                
+                curve = bpy.data.curves.new("Test", 'CURVE')
+                polyline = curve.splines.new('BEZIER')
+                polyline.bezier_points.add(num-1)
+                mustard_tools.mustardtools_ik_spline_curve_points(polyline, points, controllers, False)
+                co, handle_left, handle_right = mustard_tools.mustardtools_ik_spline_auto_handles(points, controllers)
+                
+                for i, point in enumerate(polyline.bezier_points):
+                    np.testing.assert_allclose(point.handle_left, handle_left[i], atol=1e-5)
+                    np.testing.assert_allclose(point.handle_right, handle_right[i], atol=1e-5)
+                
+                bpy.data.curves.remove(curve)
+    
+    def test_controllers(self):
+        for chain_length, amplitude, frequency, num in self.chains:
+            with self.subTest(chain_length=chain_length, amplitude=amplitude, frequency=frequency, num=num):
+                adaptive = mustard_tools.mustardtools_ik_spline_controllers_adaptive(sine_chain(chain_length, amplitude, frequency), num)
+                
+                self.assertEqual(len(adaptive), num)
+                self.assertEqual(adaptive[0], 0)
+                self.assertEqual(adaptive[-1], chain_length - 1)
+                self.assertTrue(all(a < b for a, b in zip(adaptive[:-1], adaptive[1:])))
+    
+    def test_straight_chain(self):
+        points = sine_chain(10, 0., 0.)
+        adaptive = mustard_tools.mustardtools_ik_spline_controllers_adaptive(points, 3)
+        
+        self.assertEqual(adaptive, mustard_tools.mustardtools_ik_spline_controllers(10, 3))
+        self.assertAlmostEqual(mustard_tools.mustardtools_ik_spline_fit_error(points, adaptive), 0.)
+
+class TestRebuild(unittest.TestCase):
+    
+    # A wavy chain of 10 connected bones, all selected
+    def setUp(self):
+        
+        if bpy.context.object != None and bpy.context.object.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        bpy.data.batch_remove(ids=list(bpy.data.objects) + list(bpy.data.armatures) + list(bpy.data.curves))
+        mustard_tools.mustardtools_cache_invalidate()
+        
+        data = bpy.data.armatures.new("Test")
+        self.arm = bpy.data.objects.new("Test", data)
+        bpy.context.scene.collection.objects.link(self.arm)
+        bpy.context.view_layer.objects.active = self.arm
+        self.arm.select_set(True)
+        
+        bpy.ops.object.mode_set(mode='EDIT')
+        parent = None
+        for i in range(0, 10):
+            bone = data.edit_bones.new("Bone" + str(i))
+            bone.head = (0., 0.1 * i, 0.1 * math.sin(0.6 * i))
+            bone.tail = (0., 0.1 * (i+1), 0.1 * math.sin(0.6 * (i+1)))
+            bone.parent = parent
+            bone.use_connect = parent != None
+            parent = bone
+        bpy.ops.object.mode_set(mode='POSE')
+        
+        self.settings = bpy.context.scene.mustardtools_settings
+        self.settings.ik_spline_number = 4
+        self.settings.ik_spline_symmetry = False
+    
+    def select_chain(self):
+        
+        for bone in self.arm.data.bones:
+            bone.select = bone.name.startswith("Bone")
+        bpy.context.view_layer.update()
+    
+    # Points and handles of the rig curve, and rest heads of the controllers
+    def rig_state(self):
+        
+        rig = [rig for rig in self.arm.mustardtools_rigs if rig.rig_type == 'IK_SPLINE'][0]
+        points = [tuple(point.co) + tuple(point.handle_left) + tuple(point.handle_right) for point in rig.curve.data.splines[0].bezier_points]
+        controllers = {bone_name: tuple(self.arm.data.bones[bone_name].head_local) for bone_name in mustard_tools.mustardtools_rig_bones(rig, ('CONTROLLER',))}
+        
+        return np.array(points), controllers
+    
+    # A rebuild with the settings used for the creation leaves the rig untouched
+    def rebuild_unchanged(self, adaptive, fit, bone_hooks):
+        
+        self.settings.ik_spline_adaptive = adaptive
+        self.settings.ik_spline_fit = fit
+        self.settings.ik_spline_bone_hooks = bone_hooks
+        
+        self.select_chain()
+        self.assertEqual(bpy.ops.mustardui.ik_spline(), {'FINISHED'})
+        points, controllers = self.rig_state()
+        
+        self.select_chain()
+        self.assertEqual(bpy.ops.mustardui.ik_splinerebuild(), {'FINISHED'})
+        points_rebuild, controllers_rebuild = self.rig_state()
+        
+        self.assertEqual(controllers_rebuild, controllers)
+        np.testing.assert_allclose(points_rebuild, points, atol=1e-5)
+    
+    def test_rebuild_unchanged(self):
+        self.rebuild_unchanged(False, False, False)
+    
+    def test_rebuild_unchanged_adaptive(self):
+        self.rebuild_unchanged(True, True, True)
+
+if __name__ == "__main__":
+    result = unittest.main(argv=[__file__], exit=False).result
+    sys.exit(0 if result.wasSuccessful() else 1)
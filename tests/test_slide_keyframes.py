@@ -0,0 +1,238 @@
+# Mustard Tools tests - Slide Keyframes
+# https://github.com/Mustard2/MustardTools
+#
+# Tests of the Slide Keyframes operator, to be run in background:
+#   blender -b --factory-startup --python tests/test_slide_keyframes.py
+# The modal operator cannot receive events in background, so its functions are called with stand-in events,
+# which (as the Blender ones) only have the type and the mouse position.
+
+import bpy
+import sys
+import os
+import types
+import unittest
+import numpy as np
+
+# The addon is imported from the parent folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mustard_tools
+
+def setUpModule():
+    mustard_tools.register()
+
+def tearDownModule():
+    mustard_tools.unregister()
+
+# Stand-in for the operator instance, with the functions of the operator.
+# Blender operators cannot be created from Python, so the functions are called on this object
+class SlideKeyframesOperator:
+    
+    bl_idname = mustard_tools.MUSTARDTOOLS_OT_SlideKeyframes.bl_idname
+    
+    invoke = mustard_tools.MUSTARDTOOLS_OT_SlideKeyframes.invoke
+    execute = mustard_tools.MUSTARDTOOLS_OT_SlideKeyframes.execute
+    modal = mustard_tools.MUSTARDTOOLS_OT_SlideKeyframes.modal
+    modal_event = mustard_tools.MUSTARDTOOLS_OT_SlideKeyframes.modal_event
+    finish = mustard_tools.MUSTARDTOOLS_OT_SlideKeyframes.finish
+    cancel = mustard_tools.MUSTARDTOOLS_OT_SlideKeyframes.cancel
+    
+    def __init__(self):
+        self.reports = []
+    
+    def report(self, type, message):
+        self.reports.append((type, message))
+
+# Stand-in for the window manager, keeping track of the timers
+class WindowManager:
+    
+    def __init__(self):
+        self.timers = []
+    
+    def event_timer_add(self, time_step, window=None):
+        timer = object()
+        self.timers.append(timer)
+        return timer
+    
+    def event_timer_remove(self, timer):
+        self.timers.remove(timer)
+    
+    def modal_handler_add(self, operator):
+        pass
+
+def event(type, x=0, prev_x=0):
+    
+    return types.SimpleNamespace(type=type, mouse_x=x, mouse_prev_x=prev_x, mouse_region_x=x)
+
+class SlideKeyframesModalTest(unittest.TestCase):
+    
+    # An action with keyframes on frames 0 to 9, with the ones on frames 2 to 4 selected
+    def setUp(self):
+        
+        bpy.data.batch_remove(ids=list(bpy.data.objects) + list(bpy.data.actions))
+        mustard_tools.mustardtools_slide_keyframes_index_invalidate()
+        
+        self.obj = bpy.data.objects.new("Test", None)
+        bpy.context.scene.collection.objects.link(self.obj)
+        action = bpy.data.actions.new("Test")
+        self.obj.animation_data_create().action = action
+        
+        self.fcurve = action.fcurves.new('["test"]')
+        self.fcurve.keyframe_points.add(10)
+        co = np.zeros((10, 2), dtype=np.float32)
+        co[:, 0] = np.arange(10)
+        self.fcurve.keyframe_points.foreach_set("co", co.ravel())
+        self.fcurve.keyframe_points.foreach_set("select_control_point", (co[:, 0] >= 2) & (co[:, 0] <= 4))
+        self.fcurve.update()
+        
+        self.settings = bpy.context.scene.mustardtools_settings
+        self.settings.slide_keyframes_application = '0'
+        self.settings.slide_keyframes_nla = False
+        
+        self.wm = WindowManager()
+        self.context = types.SimpleNamespace(active_object=self.obj, selected_objects=[self.obj],
+                                            window_manager=self.wm, window=None, area=None)
+        self.operator = SlideKeyframesOperator()
+    
+    def frames(self):
+        
+        co = np.empty(2 * len(self.fcurve.keyframe_points), dtype=np.float32)
+        self.fcurve.keyframe_points.foreach_get("co", co)
+        return list(co[0::2])
+    
+    # Start the slide with the mouse at the last selected frame
+    def invoke(self, coalesce):
+        
+        self.settings.slide_keyframes_coalesce = coalesce
+        self.assertEqual(self.operator.invoke(self.context, event('NONE', 40)), {'RUNNING_MODAL'})
+    
+    def test_coalesced_slide(self):
+        
+        self.invoke(True)
+        self.assertEqual(len(self.wm.timers), 1)
+        
+        # The mouse moves are applied only by the timer
+        self.assertEqual(self.operator.modal(self.context, event('MOUSEMOVE', 60, 40)), {'RUNNING_MODAL'})
+        self.assertEqual(self.frames(), list(range(10)))
+        self.assertEqual(self.operator.modal(self.context, event('TIMER')), {'RUNNING_MODAL'})
+        self.assertEqual(self.frames(), [0, 1, 2, 4, 6, 7, 8, 9, 10, 11])
+        
+        # The pending move is applied when confirming
+        self.operator.modal(self.context, event('MOUSEMOVE', 80, 60))
+        self.assertEqual(self.operator.modal(self.context, event('LEFTMOUSE')), {'FINISHED'})
+        self.assertEqual(self.frames(), [0, 1, 2, 5, 8, 9, 10, 11, 12, 13])
+        self.assertEqual(len(self.wm.timers), 0)
+    
+    def test_cancel(self):
+        
+        self.invoke(False)
+        self.operator.modal(self.context, event('MOUSEMOVE', 60, 40))
+        self.assertEqual(self.frames(), [0, 1, 2, 4, 6, 7, 8, 9, 10, 11])
+        
+        self.assertEqual(self.operator.modal(self.context, event('ESC')), {'CANCELLED'})
+        self.assertEqual(self.frames(), list(range(10)))
+    
+    # If a step fails, the keyframes are restored and the timer removed
+    def test_error(self):
+        
+        self.invoke(True)
+        self.operator.modal(self.context, event('MOUSEMOVE', 60, 40))
+        self.operator.modal(self.context, event('TIMER'))
+        
+        def step(new_end=None):
+            raise RuntimeError("Test error")
+        self.operator.session.step = step
+        
+        self.operator.modal(self.context, event('MOUSEMOVE', 80, 60))
+        self.assertEqual(self.operator.modal(self.context, event('TIMER')), {'CANCELLED'})
+        self.assertEqual(self.frames(), list(range(10)))
+        self.assertEqual(len(self.wm.timers), 0)
+        self.assertEqual(self.operator.reports[-1][0], {'ERROR'})
+    
+    # Blender calls cancel when the slide is interrupted (e.g. by loading a file)
+    def test_external_cancel(self):
+        
+        self.invoke(True)
+        self.operator.modal(self.context, event('MOUSEMOVE', 60, 40))
+        self.operator.modal(self.context, event('TIMER'))
+        
+        self.operator.cancel(self.context)
+        self.assertEqual(self.frames(), list(range(10)))
+        self.assertEqual(len(self.wm.timers), 0)
+
+# The Dope Sheet select operators do not update the depsgraph, so the poll must not keep a stale selection
+class SlideKeyframesPollTest(unittest.TestCase):
+    
+    # An action with keyframes on frames 0 to 9, shown in a Dope Sheet editor
+    def setUp(self):
+        
+        bpy.data.batch_remove(ids=list(bpy.data.objects) + list(bpy.data.actions))
+        mustard_tools.mustardtools_slide_keyframes_index_invalidate()
+        
+        self.obj = bpy.data.objects.new("Test", None)
+        bpy.context.scene.collection.objects.link(self.obj)
+        action = bpy.data.actions.new("Test")
+        self.obj.animation_data_create().action = action
+        
+        self.fcurve = action.fcurves.new('["test"]')
+        self.fcurve.keyframe_points.add(10)
+        co = np.zeros((10, 2), dtype=np.float32)
+        co[:, 0] = np.arange(10)
+        self.fcurve.keyframe_points.foreach_set("co", co.ravel())
+        self.fcurve.update()
+        
+        self.settings = bpy.context.scene.mustardtools_settings
+        self.settings.slide_keyframes_application = '0'
+        self.settings.slide_keyframes_nla = False
+        
+        self.context = types.SimpleNamespace(active_object=self.obj, selected_objects=[self.obj],
+                                            window_manager=bpy.context.window_manager)
+        
+        window = bpy.context.window_manager.windows[0]
+        area = window.screen.areas[0]
+        area.type = 'DOPESHEET_EDITOR'
+        area.spaces.active.mode = 'DOPESHEET'
+        area.spaces.active.dopesheet.show_only_selected = False
+        region = [region for region in area.regions if region.type == 'WINDOW'][0]
+        self.override = {"window": window, "screen": window.screen, "area": area, "region": region}
+    
+    def select_all(self, action):
+        
+        if hasattr(bpy.context, "temp_override"):
+            with bpy.context.temp_override(**self.override):
+                bpy.ops.action.select_all(action=action)
+        else:
+            bpy.ops.action.select_all(self.override, action=action)
+    
+    def poll(self):
+        
+        return mustard_tools.MUSTARDTOOLS_OT_SlideKeyframes.poll(self.context)
+    
+    def test_select_after_empty_poll(self):
+        
+        self.select_all('DESELECT')
+        self.assertFalse(self.poll())
+        
+        self.select_all('SELECT')
+        self.assertTrue(self.poll())
+    
+    def test_select_after_single_frame_poll(self):
+        
+        self.select_all('DESELECT')
+        self.fcurve.keyframe_points[3].select_control_point = True
+        mustard_tools.mustardtools_slide_keyframes_index_invalidate()
+        self.assertFalse(self.poll())
+        
+        self.select_all('SELECT')
+        self.assertTrue(self.poll())
+    
+    def test_deselect_after_poll(self):
+        
+        self.select_all('SELECT')
+        self.assertTrue(self.poll())
+        
+        self.select_all('DESELECT')
+        self.assertFalse(self.poll())
+
+if __name__ == "__main__":
+    result = unittest.main(argv=[__file__], exit=False).result
+    sys.exit(0 if result.wasSuccessful() else 1)